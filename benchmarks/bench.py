@@ -0,0 +1,285 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from werkzeug.test import EnvironBuilder
+
+from ptrs.app import create_app
+from ptrs.app.county import DEFAULT_BOUNDARY, CountyBoundary
+from ptrs.app.reports import REPAIR_WINDOW, RepairStatus, Report
+from ptrs.app.storage import SQLiteReportStore
+
+"""
+Load-test benchmarks for the PTRS Flask app.
+
+Seeds synthetic potholes spread across the county at each requested
+size, then drives the app's WSGI callable in-process, one client at
+a time and with concurrent client threads, and reports throughput and
+p50/p95/p99 latency per route. Runs are reproducible: the synthetic
+data and every request come from a seeded random generator.
+
+Each scenario runs warm, with the response cache on, and cold, with
+RESPONSE_CACHE_SIZE=0 so every /data request is queried, serialized
+and compressed afresh. Warm runs mostly measure cache hits; cold runs
+show how the cost of a request grows with the number of reports.
+data-all answers with every report, so it is run with fewer requests
+(--full-data-requests) rather than skipped at large sizes.
+
+Seeded databases are kept in --cache-dir and copied for each run,
+since seeding a million reports takes a while and the write scenarios
+change the data.
+
+    python benchmarks/bench.py --sizes 1000 100000 1000000 --clients 1 8
+    python benchmarks/bench.py --caches cold --scenarios data-all data-viewport
+"""
+
+SCENARIOS = (
+    "about",
+    "pothole-page",
+    "pothole-submit",
+    "data-all",
+    "data-viewport",
+    "data-radius",
+    "data-since",
+)
+
+# response cache size for each --caches mode
+CACHES = {"warm": 64 * 1024 * 1024, "cold": 0}
+
+# synthetic reports are dated within this window
+EPOCH = int(datetime(2024, 1, 1).timestamp())
+SPAN = 365 * 24 * 3600
+
+
+def random_points(county, rng):
+    """Endless random (lat, lng) points inside the county."""
+    west, south, east, north = county.bbox
+    while True:
+        lat, lng = rng.uniform(south, north), rng.uniform(west, east)
+        if county.contains(lat, lng):
+            yield lat, lng
+
+
+def synthetic_reports(count, county, rng):
+    points = random_points(county, rng)
+    statuses = list(RepairStatus)
+    for i in range(count):
+        lat, lng = next(points)
+        reported_at = EPOCH + rng.randrange(SPAN)
+        yield Report(
+            latitude=lat,
+            longitude=lng,
+            address=f"{i} Synthetic Rd, Indiana, PA 15701",
+            size=rng.randint(0, 100),
+            status=rng.choices(statuses, weights=(6, 1, 3))[0],
+            reported_at=reported_at,
+            expected_at=reported_at + int(REPAIR_WINDOW.total_seconds()),
+        )
+
+
+def seeded_database(cache_dir, size, county, seed):
+    """Path of a database with size synthetic reports, seeding it if needed."""
+    path = os.path.join(cache_dir, f"ptrs-{size}-{seed}.sqlite3")
+    if not os.path.exists(path):
+        print(f"seeding {size} reports into {path}", file=sys.stderr)
+        started = time.perf_counter()
+        partial = path + ".partial"
+        # an interrupted run leaves its half-seeded database behind,
+        # which would otherwise be appended to
+        for leftover in (partial, partial + "-wal", partial + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        store = SQLiteReportStore(partial, batch_size=10_000)
+        store.add_many(synthetic_reports(size, county, random.Random(seed)))
+        store.close()
+        os.replace(partial, path)
+        elapsed = time.perf_counter() - started
+        print(f"seeded in {elapsed:.1f}s", file=sys.stderr)
+    return path
+
+
+class Client:
+    """Builds the WSGI environ for each scenario's requests."""
+
+    def __init__(self, county, store, rng, viewports=50):
+        self.rng = rng
+        self.store = store
+        self.points = random_points(county, rng)
+        # a fixed pool of map views, like the handful most people look at
+        self.viewports = [self._viewport(*next(self.points)) for _ in range(viewports)]
+
+    @staticmethod
+    def _viewport(lat, lng, half=0.025):
+        return f"{lng - half},{lat - half},{lng + half},{lat + half}"
+
+    def environ(self, scenario):
+        headers = {"Accept-Encoding": "gzip"}
+        method, path, query, data = "GET", "/data", None, None
+        if scenario == "about":
+            path = "/about"
+        elif scenario == "pothole-page":
+            path = "/pothole"
+        elif scenario == "pothole-submit":
+            lat, lng = next(self.points)
+            method, path = "POST", "/pothole"
+            data = {
+                "latitude": lat,
+                "longitude": lng,
+                "address": "1 Benchmark St",
+                "size": self.rng.randint(0, 100),
+            }
+        elif scenario == "data-viewport":
+            query = {"bbox": self.rng.choice(self.viewports), "limit": 1000}
+        elif scenario == "data-radius":
+            lat, lng = next(self.points)
+            query = {"lat": lat, "lng": lng, "radius": 500}
+        elif scenario == "data-since":
+            query = {"since": max(self.store.version() - 100, 0), "limit": 100}
+        builder = EnvironBuilder(
+            method=method, path=path, query_string=query, data=data, headers=headers
+        )
+        try:
+            return builder.get_environ()
+        finally:
+            builder.close()
+
+
+def request(app, environ):
+    """Run one request through the WSGI app and return (status, body size)."""
+    status = []
+
+    def start_response(line, headers, exc_info=None):
+        status.append(int(line.split(" ", 1)[0]))
+
+    body = app(environ, start_response)
+    try:
+        size = sum(len(chunk) for chunk in body)
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+    return status[0], size
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def run(app, client, scenario, requests, clients):
+    environs = [client.environ(scenario) for _ in range(requests)]
+
+    def worker(share):
+        timings, errors, size = [], 0, 0
+        for environ in share:
+            started = time.perf_counter()
+            status, length = request(app, environ)
+            timings.append(time.perf_counter() - started)
+            errors += status >= 400
+            size += length
+        return timings, errors, size
+
+    shares = [environs[i::clients] for i in range(clients)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        results = list(pool.map(worker, shares))
+    elapsed = time.perf_counter() - started
+    timings = sorted(t for result in results for t in result[0])
+    return {
+        "scenario": scenario,
+        "clients": clients,
+        "requests": requests,
+        "errors": sum(result[1] for result in results),
+        "throughput": requests / elapsed,
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p95_ms": percentile(timings, 0.95) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000,
+        "mean_bytes": sum(result[2] for result in results) / requests,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test benchmarks for PTRS.")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument(
+        "--caches",
+        nargs="+",
+        choices=CACHES,
+        default=list(CACHES),
+        help="run with the response cache on (warm), off (cold) or both",
+    )
+    parser.add_argument(
+        "--full-data-requests",
+        type=int,
+        default=20,
+        help="requests per data-all run, which returns every report",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--cache-dir",
+        default=os.path.join(os.path.dirname(__file__), ".cache"),
+        help="where seeded databases are kept between runs",
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    county = CountyBoundary.from_geojson(DEFAULT_BOUNDARY)
+    os.makedirs(args.cache_dir, exist_ok=True)
+    results = []
+    header = (
+        f"{'reports':>8} {'scenario':<15} {'cache':<5} {'clients':>7} {'req/s':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'bytes':>9} {'errors':>6}"
+    )
+    print(header)
+    for size in args.sizes:
+        seeded = seeded_database(args.cache_dir, size, county, args.seed)
+        for scenario, cache, clients in itertools.product(
+            args.scenarios, args.caches, args.clients
+        ):
+            requests = args.requests
+            if scenario == "data-all":
+                requests = min(requests, args.full_data_requests)
+            with tempfile.TemporaryDirectory() as workdir:
+                database = os.path.join(workdir, "ptrs.sqlite3")
+                shutil.copyfile(seeded, database)
+                app = create_app(
+                    {
+                        "DATABASE": database,
+                        "SEED_DEMO_DATA": False,
+                        "RESPONSE_CACHE_SIZE": CACHES[cache],
+                    }
+                )
+                store = app.extensions["ptrs.store"]
+                client = Client(county, store, random.Random(args.seed))
+                result = run(app, client, scenario, requests, clients)
+                store.close()
+            result["reports"] = size
+            result["cache"] = cache
+            results.append(result)
+            print(
+                f"{size:>8} {scenario:<15} {cache:<5} {clients:>7} "
+                f"{result['throughput']:>9.1f} {result['p50_ms']:>8.2f} "
+                f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                f"{result['mean_bytes']:>9.0f} {result['errors']:>6}",
+                flush=True,
+            )
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
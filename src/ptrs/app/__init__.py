@@ -1,80 +1,193 @@
-from flask import Flask, render_template, request
+import heapq
+import math
+import os
+import time
+from operator import itemgetter
+
+import click
+from flask import Flask, abort, g, render_template, request
+
+from ptrs.app.analytics import (
+    DAY,
+    DENSITY_ZOOM,
+    MAX_GRID_CELLS,
+    MAX_WINDOW_DAYS,
+    day_of,
+    grid_shape,
+    stream_grid,
+    summarize,
+)
+from ptrs.app.cache import ResponseCache
+from ptrs.app.clusters import CELL_SIZES, MAX_REPORT_SPAN, MAX_ZOOM, MIN_ZOOM
+from ptrs.app.county import (
+    DEFAULT_BOUNDARY,
+    CountyBoundary,
+    GeocodeCache,
+    ReverseGeocoder,
+)
+from ptrs.app.ingest import ingest_ndjson, parse_merge_distance
+from ptrs.app.metrics import Metrics, instrument
+from ptrs.app.reports import (
+    RepairStatus,
+    ReportFilter,
+    Severity,
+    new_report,
+    to_epoch,
+)
+from ptrs.app.spatial import WORLD, parse_bbox, parse_point
+from ptrs.app.storage import SEED_REPORTS, create_store
 
 """
 When you import the ptrs.app package,
 all code in this module will be run automatically.
+
+Reports live in a storage backend chosen by the STORAGE
+config value (see ptrs.app.storage). Any config value can
+also be set through a PTRS_-prefixed environment variable,
+e.g. PTRS_STORAGE=memory or PTRS_DATABASE=/var/lib/ptrs/ptrs.sqlite3.
 """
 
-NEWPOTHOLEINFO = {
-    "longitude": 0,
-    "latitude": 0,
-    "address": "",
-    "size": 0,
-    "location": "",
-    "other": "",
-}
-
-POTHOLES = [
-    {
-        "latitude": 40.61784839360533,
-        "longitude": -79.14349968544316,
-        "address": "310 Locust St, Indiana, PA 15701",
-        "size": 5,
-        "location": "Turning lane",
-        "other": "",
-        "repairStatus": "Not Repaired",
-        "reportDate": "11:39AM on October 26th 2024",
-        "expectedCompletion": "October 28th 2024",
-    },
-    {
-        "latitude": 40.78190387919964,
-        "longitude": -79.05321749721166,
-        "address": "9819 Rte 119 Hwy N, Marion Center, PA 0",
-        "size": 8,
-        "location": "By parking",
-        "other": "",
-        "repairStatus": "Not Repaired",
-        "reportDate": "7:23PM on October 26th 2024",
-        "expectedCompletion": "October 28th 2024",
-    },
-    {
-        "latitude": 40.62053120537463,
-        "longitude": -78.91648685182243,
-        "address": "6424 PA-403, Homer City, PA 15748",
-        "size": 2,
-        "location": "",
-        "other": "",
-        "repairStatus": "Not Repaired",
-        "reportDate": "12:05AM on October 27th 2024",
-        "expectedCompletion": "October 28th 2024",
-    },
-    {
-        "latitude": 40.53661477640323,
-        "longitude": -79.06485400700325,
-        "address": "5533 Rte 422 Hwy W, Indiana, PA 15701",
-        "size": 7,
-        "location": "",
-        "other": "",
-        "repairStatus": "Not Repaired",
-        "reportDate": "5:17PM on October 27th 2024",
-        "expectedCompletion": "October 28th 2024",
-    },
-    {
-        "latitude": 40.66118746305543,
-        "longitude": -79.0205031224644,
-        "address": "1385 Dixon Rd, Clymer, PA 15728",
-        "size": 1,
-        "location": "",
-        "other": "",
-        "repairStatus": "Not Repaired",
-        "reportDate": "8:21PM on October 27th 2024",
-        "expectedCompletion": "October 28th 2024",
-    },
-]
-
-
-def create_app():
-    app = Flask(__name__, template_folder="../templates", static_folder="../static")
+
+# the largest integer SQLite can store
+MAX_INTEGER = 2**63 - 1
+
+
+def _parse_count(args, name):
+    """Read a non-negative integer argument, or None if it is missing."""
+    if name not in args:
+        return None
+    value = int(args[name])
+    if not 0 <= value <= MAX_INTEGER:
+        raise ValueError(f"{name} must be between 0 and {MAX_INTEGER}")
+    return value
+
+
+def _parse_query(args):
+    """
+    Read the /data GET filters:
+    bbox=west,south,east,north, lat+lng+radius (meters) and limit.
+    """
+    bbox = parse_bbox(args["bbox"]) if "bbox" in args else None
+    near = None
+    if "radius" in args:
+        lat, lng = parse_point(args["lat"], args["lng"])
+        radius = float(args["radius"])
+        if not 0 <= radius < math.inf:
+            raise ValueError("radius must be a non-negative number")
+        near = (lat, lng, radius)
+    return bbox, near, _parse_count(args, "limit")
+
+
+def _parse_filters(args):
+    """
+    Read the /data GET attribute filters: status (comma-separated),
+    severity, min_size and max_size (0-10), reported_after
+    and reported_before (ISO 8601 or epoch seconds).
+    """
+    filters = ReportFilter()
+    if "status" in args:
+        filters.statuses = {
+            RepairStatus.parse(status) for status in args["status"].split(",")
+        }
+    if "severity" in args:
+        severity = Severity[args["severity"].strip().upper()]
+        filters.min_size, filters.max_size = severity.sizes
+    for name in ("min_size", "max_size"):
+        if name in args:
+            size = float(args[name])
+            if not 0 <= size <= 10:
+                raise ValueError(f"{name} must be between 0 and 10")
+            setattr(filters, name, round(size * 10))
+    for name in ("reported_after", "reported_before"):
+        if name in args:
+            value = args[name]
+            setattr(filters, name, to_epoch(int(value) if value.isdigit() else value))
+    return filters
+
+
+# the /data GET arguments that pick out some of the reports
+SELECTION_ARGS = (
+    "bbox",
+    "lat",
+    "lng",
+    "radius",
+    "status",
+    "severity",
+    "min_size",
+    "max_size",
+    "reported_after",
+    "reported_before",
+)
+
+
+def _parse_cursor(args):
+    """
+    Read the /data GET delta feed arguments: since=<cursor> and limit.
+    The feed returns every changed report, so none of SELECTION_ARGS apply.
+    """
+    selection = [name for name in SELECTION_ARGS if name in args]
+    if selection:
+        raise ValueError(f"since can't be combined with {', '.join(selection)}")
+    return _parse_count(args, "since"), _parse_count(args, "limit")
+
+
+def create_app(test_config=None):
+    app = Flask(
+        __name__,
+        template_folder="../templates",
+        static_folder="../static",
+        instance_relative_config=True,
+    )
+    app.config.from_mapping(
+        STORAGE="sqlite",
+        DATABASE=os.path.join(app.instance_path, "ptrs.sqlite3"),
+        DATABASE_BATCH_SIZE=1000,
+        SEED_DEMO_DATA=True,
+        COUNTY_BOUNDARY=DEFAULT_BOUNDARY,
+        GEOCODE_CACHE_SIZE=10_000,
+        GEOCODING_API_KEY=None,
+        MERGE_DISTANCE=10.0,
+        RESPONSE_CACHE_SIZE=64 * 1024 * 1024,
+        METRICS=False,
+        REPAIR_TIME_WINDOW_DAYS=30,
+        CLUSTER_LIMIT=1000,
+    )
+    app.config.from_prefixed_env("PTRS")
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+
+    store = create_store(app.config)
+    if app.config["SEED_DEMO_DATA"]:
+        store.seed(SEED_REPORTS)
+    app.extensions["ptrs.store"] = store
+
+    county = CountyBoundary.from_geojson(app.config["COUNTY_BOUNDARY"])
+    geocode_cache = GeocodeCache(app.config["GEOCODE_CACHE_SIZE"])
+    geocoder = (
+        ReverseGeocoder(app.config["GEOCODING_API_KEY"])
+        if app.config["GEOCODING_API_KEY"]
+        else None
+    )
+    response_cache = ResponseCache(app.config["RESPONSE_CACHE_SIZE"])
+    app.extensions["ptrs.response_cache"] = response_cache
+
+    if app.config["METRICS"]:
+        metrics = Metrics()
+        instrument(app, metrics)
+        app.extensions["ptrs.metrics"] = metrics
+
+    def check_location(latitude, longitude):
+        if not county.contains(latitude, longitude):
+            abort(400, "Chosen pin is not within Indiana County!")
+
+    def send_cached(entry):
+        # the body goes out exactly as cached, in the best encoding the client takes
+        encoding, body = entry.negotiate(request.accept_encodings)
+        response = app.response_class(body, mimetype=entry.mimetype)
+        if encoding != "identity":
+            response.content_encoding = encoding
+        response.vary.add("Accept-Encoding")
+        return response
 
     @app.route("/about")
     def about():
@@ -83,19 +196,261 @@ def create_app():
     @app.route("/pothole", methods=["GET", "POST"])
     def pothole():
         if request.method == "POST":
-            NEWPOTHOLEINFO["size"] = float(request.form.get("size")) / 10
-            NEWPOTHOLEINFO["location"] = request.form.get("location")
-            NEWPOTHOLEINFO["other"] = request.form.get("other")
-        return render_template("pothole.html")
+            # the whole report arrives in one form post, so it is stored
+            # in one transaction and can't be mixed up with other users'
+            try:
+                report = new_report(
+                    latitude=request.form["latitude"],
+                    longitude=request.form["longitude"],
+                    address=request.form.get("address"),
+                    size=float(request.form.get("size", 0)) / 10,
+                    location=request.form.get("location"),
+                    other=request.form.get("other"),
+                )
+            except (KeyError, ValueError, OverflowError):
+                abort(400, "A report needs a pin on the map and a valid size.")
+            check_location(report.latitude, report.longitude)
+            store.add(report)
+        # the page doesn't depend on the reports, so it is rendered only once
+        page = response_cache.get(
+            ("page", "pothole.html"),
+            0,
+            lambda: render_template("pothole.html").encode(),
+            mimetype="text/html",
+        )
+        return send_cached(page)
 
     @app.route("/data", methods=["GET", "POST"])
     def process_data():
         if request.method == "POST":
-            NEWPOTHOLEINFO["longitude"] = request.json["longitude"]
-            NEWPOTHOLEINFO["latitude"] = request.json["latitude"]
-            NEWPOTHOLEINFO["address"] = request.json["address"]
+            # the chosen location is sent back with the report form,
+            # so here it is only checked
+            try:
+                longitude = float(request.json["longitude"])
+                latitude = float(request.json["latitude"])
+            except (KeyError, TypeError, ValueError):
+                abort(400, "Expected latitude and longitude.")
+            check_location(latitude, longitude)
             return "success"
         elif request.method == "GET":
-            return POTHOLES
+            if "since" in request.args:
+                # delta feed: only what changed after the client's cursor
+                try:
+                    cursor, limit = _parse_cursor(request.args)
+                    if cursor > store.version():
+                        # a cursor from another database, or made up
+                        raise ValueError("since is past the latest change")
+                except ValueError as error:
+                    abort(400, f"Invalid query: {error}")
+                reports, cursor = store.changes_since(cursor, limit)
+                return {
+                    "reports": [report.to_dict() for report in reports],
+                    "cursor": cursor,
+                }
+
+            try:
+                bbox, near, limit = _parse_query(request.args)
+                filters = _parse_filters(request.args)
+            except (KeyError, ValueError) as error:
+                abort(400, f"Invalid query: {error}")
+            # every change bumps the store version, so it doubles as an
+            # ETag and as the response cache's version: unchanged data is
+            # never queried, serialized or compressed again
+            version = store.version()
+            etag = str(version)
+            # weak, because the identity and compressed bodies share it
+            if request.if_none_match.contains_weak(etag):
+                response = app.make_response(("", 304))
+                response.vary.add("Accept-Encoding")
+            else:
+
+                def serialize():
+                    reports = store.query(
+                        bbox=bbox, near=near, limit=limit, filters=filters
+                    )
+                    started = time.perf_counter()
+                    body = app.json.dumps([r.to_dict() for r in reports]).encode()
+                    g.serialization_seconds = time.perf_counter() - started
+                    return body
+
+                key = ("data", tuple(sorted(request.args.items(multi=True))))
+                response = send_cached(response_cache.get(key, version, serialize))
+            response.set_etag(etag, weak=True)
+            response.cache_control.no_cache = True
+            return response
+
+    @app.route("/data/bulk", methods=["POST"])
+    def bulk_data():
+        # the body is read line by line straight off the request stream
+        try:
+            merge_distance = parse_merge_distance(
+                request.args.get("merge_distance", app.config["MERGE_DISTANCE"])
+            )
+        except ValueError as error:
+            abort(400, f"Invalid query: {error}")
+        return ingest_ndjson(
+            store,
+            request.stream,
+            county=county,
+            merge_distance=merge_distance,
+            batch_size=app.config["DATABASE_BATCH_SIZE"],
+        )
+
+    @app.route("/geocode")
+    def geocode():
+        # answers map clicks locally: whether the point is in the county,
+        # and its address if a click near the same spot was resolved before.
+        # Only the server's own lookups are cached, as the cached addresses
+        # are handed to every user
+        try:
+            latitude = float(request.args["lat"])
+            longitude = float(request.args["lng"])
+        except (KeyError, ValueError) as error:
+            abort(400, f"Invalid query: {error}")
+        if not county.contains(latitude, longitude):
+            return {"inCounty": False, "address": None}
+        address = geocode_cache.get(latitude, longitude)
+        if address is None and geocoder is not None:
+            address = geocoder.lookup(latitude, longitude)
+            if address:
+                geocode_cache.put(latitude, longitude, address)
+        return {"inCounty": True, "address": address or None}
+
+    @app.route("/clusters")
+    def clusters():
+        # zoomed out, the map gets precomputed clusters for its viewport;
+        # zoomed in past clusters.MAX_ZOOM, it gets the potholes themselves
+        try:
+            zoom = int(request.args["zoom"])
+            bbox, _, limit = _parse_query(request.args)
+            # the potholes themselves are only looked up for a viewport,
+            # never for every report in the store
+            if zoom > MAX_ZOOM and (
+                bbox is None
+                or max(bbox[2] - bbox[0], bbox[3] - bbox[1]) > MAX_REPORT_SPAN
+            ):
+                raise ValueError(
+                    f"past zoom {MAX_ZOOM}, bbox is required and can be "
+                    f"at most {MAX_REPORT_SPAN} degrees across"
+                )
+        except (KeyError, ValueError) as error:
+            abort(400, f"Invalid query: {error}")
+        bbox = bbox or WORLD
+        limit = app.config["CLUSTER_LIMIT"] if limit is None else limit
+        if zoom > MAX_ZOOM:
+            # if there are too many, keep the ones nearest the middle of the view
+            centre = ((bbox[1] + bbox[3]) / 2, (bbox[0] + bbox[2]) / 2)
+            reports = store.query(bbox=bbox, near=(*centre, math.inf), limit=limit + 1)
+            return {
+                "zoom": zoom,
+                "clusters": [],
+                "reports": [report.to_dict() for report in reports[:limit]],
+                "truncated": len(reports) > limit,
+            }
+        clusters = store.clusters(max(zoom, MIN_ZOOM), bbox)
+        truncated = len(clusters) > limit
+        if truncated:
+            # keep the biggest clusters
+            clusters = heapq.nlargest(limit, clusters, key=itemgetter("count"))
+        return {
+            "zoom": zoom,
+            "clusters": clusters,
+            "reports": [],
+            "truncated": truncated,
+        }
+
+    @app.route("/analytics")
+    def analytics():
+        # built from the stores' running aggregates, never from the reports
+        try:
+            window = int(
+                request.args.get("window", app.config["REPAIR_TIME_WINDOW_DAYS"])
+            )
+            if not 1 <= window <= MAX_WINDOW_DAYS:
+                raise ValueError(f"window must be 1 to {MAX_WINDOW_DAYS} days")
+        except ValueError as error:
+            abort(400, f"Invalid query: {error}")
+        now = time.time()
+
+        def serialize():
+            # the window ends today, so it is rebuilt when the day changes too
+            repairs = store.repairs(now - (window - 1) * DAY)
+            summary = summarize(store.stats(), repairs, window)
+            started = time.perf_counter()
+            body = app.json.dumps(summary).encode()
+            g.serialization_seconds = time.perf_counter() - started
+            return body
+
+        key = ("analytics", window, day_of(now))
+        return send_cached(response_cache.get(key, store.version(), serialize))
+
+    @app.route("/analytics/density")
+    def density():
+        # one entry per non-empty grid cell, as JSON or as a dense
+        # binary grid (see ptrs.app.analytics.GRID_HEADER) streamed row by row
+        try:
+            zoom = int(request.args.get("zoom", DENSITY_ZOOM))
+            if not MIN_ZOOM <= zoom <= MAX_ZOOM:
+                raise ValueError(f"zoom must be between {MIN_ZOOM} and {MAX_ZOOM}")
+            bbox = parse_bbox(request.args["bbox"]) if "bbox" in request.args else None
+            output = request.args.get("format", "json")
+            if output not in ("json", "binary"):
+                raise ValueError("format must be json or binary")
+        except ValueError as error:
+            abort(400, f"Invalid query: {error}")
+        bbox = bbox or county.bbox
+        cells = store.density(zoom, bbox)
+        if output == "json":
+            return {"zoom": zoom, "cellSize": CELL_SIZES[zoom], "cells": cells}
+        _, _, width, height = grid_shape(zoom, bbox)
+        if width * height > MAX_GRID_CELLS:
+            abort(400, "Grid too large, ask for a smaller bbox or zoom.")
+        return app.response_class(
+            stream_grid(zoom, bbox, cells), mimetype="application/octet-stream"
+        )
+
+    @app.cli.command("set-status")
+    @click.argument("report_id", type=int)
+    @click.argument("status")
+    def set_status(report_id, status):
+        """Change the repair status of a report, e.g. "In Progress" or REPAIRED."""
+        try:
+            status = RepairStatus.parse(status)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+        if not store.update_status(report_id, status):
+            raise click.ClickException(f"There is no report with id {report_id}.")
+
+    @app.cli.command("ingest")
+    @click.argument("file", type=click.File("rb"))
+    @click.option(
+        "--merge-distance",
+        type=float,
+        default=None,
+        help="Merge reports this close (in meters) to an unrepaired one.",
+    )
+    def ingest(file, merge_distance):
+        """Import reports from an NDJSON file ("-" for stdin)."""
+        try:
+            merge_distance = parse_merge_distance(
+                app.config["MERGE_DISTANCE"]
+                if merge_distance is None
+                else merge_distance
+            )
+        except ValueError as error:
+            raise click.BadParameter(str(error), param_hint="--merge-distance")
+        summary = ingest_ndjson(
+            store,
+            file,
+            county=county,
+            merge_distance=merge_distance,
+            batch_size=app.config["DATABASE_BATCH_SIZE"],
+        )
+        for error in summary["errors"]:
+            click.echo(f"line {error['line']}: {error['error']}", err=True)
+        click.echo(
+            f"{summary['inserted']} inserted, {summary['merged']} merged, "
+            f"{summary['rejected']} rejected"
+        )
 
     return app
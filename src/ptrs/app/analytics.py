@@ -0,0 +1,105 @@
+import struct
+import sys
+from array import array
+from collections import defaultdict
+
+from ptrs.app.clusters import cell_range
+from ptrs.app.reports import RepairStatus, Severity
+
+"""
+Backlog statistics and density grids for dashboards.
+
+Stores keep three aggregates up to date as reports are added,
+merged or change status, so no dashboard query ever reads reports:
+
+- counts of reports by (RepairStatus, Severity),
+- per-day repair totals (how many reports were repaired that day and
+  the seconds each took from report to repair), for a rolling average
+  time-to-repair over the last few days,
+- the density grid, which is the cluster cells (see ptrs.app.clusters)
+  at a fixed zoom level, so a heatmap reads one row per non-empty cell.
+"""
+
+DAY = 24 * 3600
+DENSITY_ZOOM = 14
+MAX_GRID_CELLS = 4_000_000
+# time-to-repair averages look back at most this many days
+MAX_WINDOW_DAYS = 36_500
+
+# zoom, min_x, min_y, width, height; then height rows of width
+# (count, open_count) uint32 pairs, south to north, west to east
+GRID_HEADER = struct.Struct("<iiiII")
+
+
+def day_of(timestamp):
+    return int(timestamp) // DAY
+
+
+def stat_deltas(changes):
+    """Fold (status, size, count) changes into {(status, severity): delta}."""
+    deltas = defaultdict(int)
+    for status, size, count in changes:
+        deltas[(RepairStatus(status), Severity.of(size))] += count
+    return deltas
+
+
+def report_stat(report):
+    """The stats change caused by storing a new report."""
+    return (report.status, report.size, 1)
+
+
+def summarize(stats, repairs, window_days):
+    """
+    The /analytics response from store.stats() and store.repairs():
+    counts by status, severity and both, plus the average time to repair
+    over the last window_days.
+    """
+    by_status = {status.label: 0 for status in RepairStatus}
+    by_severity = {severity.name.lower(): 0 for severity in Severity}
+    by_both = {status.label: dict(by_severity) for status in RepairStatus}
+    for (status, severity), count in stats.items():
+        by_status[status.label] += count
+        by_severity[severity.name.lower()] += count
+        by_both[status.label][severity.name.lower()] += count
+    repaired, seconds = repairs
+    total = sum(by_status.values())
+    return {
+        "total": total,
+        "open": total - by_status[RepairStatus.REPAIRED.label],
+        "byStatus": by_status,
+        "bySeverity": by_severity,
+        "byStatusAndSeverity": by_both,
+        "timeToRepair": {
+            "windowDays": window_days,
+            "repairs": repaired,
+            "averageHours": seconds / repaired / 3600 if repaired else None,
+        },
+    }
+
+
+def grid_shape(zoom, bbox):
+    """(min_x, min_y, width, height) of the density grid covering bbox."""
+    min_x, min_y, max_x, max_y = cell_range(zoom, bbox)
+    return min_x, min_y, max_x - min_x + 1, max_y - min_y + 1
+
+
+def stream_grid(zoom, bbox, cells):
+    """
+    Yield a dense binary density grid (GRID_HEADER, then one row
+    at a time) from the sparse (x, y, count, open_count) cells of
+    store.density(), which must be ordered by y, then x.
+    """
+    min_x, min_y, width, height = grid_shape(zoom, bbox)
+    yield GRID_HEADER.pack(zoom, min_x, min_y, width, height)
+    cells = iter(cells)
+    cell = next(cells, None)
+    for y in range(min_y, min_y + height):
+        row = array("I", bytes(8 * width))
+        while cell is not None and cell[1] == y:
+            x = cell[0] - min_x
+            row[2 * x] = cell[2]
+            row[2 * x + 1] = cell[3]
+            cell = next(cells, None)
+        if sys.byteorder == "big":
+            row.byteswap()
+        yield row.tobytes()
@@ -0,0 +1,111 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+"""
+Cache of ready-to-send response bodies.
+
+Each entry keeps a response body serialized once, together with its
+gzip (and, if the brotli package is installed, brotli) encoding, so a
+cache hit is answered with bytes as they are and never re-serialized
+or re-compressed.
+
+Entries are tagged with the version of the data they were built from,
+normally the store version (see ptrs.app.storage). Every write bumps
+that version, and an entry is only used while its version is current.
+With SQLite the version is read from the shared database, so each
+gunicorn worker keeps its own cache but none of them ever serves a
+response built from older data than the others have seen.
+
+The cache is capped at max_bytes of stored bodies (every encoding
+counted) and evicts the least recently used entries beyond that.
+"""
+
+# bodies smaller than this aren't worth a Content-Encoding
+MIN_COMPRESS_SIZE = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def encode(body):
+    """Map each content encoding ("identity" included) to the encoded body."""
+    variants = {"identity": body}
+    if len(body) < MIN_COMPRESS_SIZE:
+        return variants
+    compressed = {"gzip": gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        compressed["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    # keep only the encodings that actually save bytes
+    variants.update(
+        (encoding, data)
+        for encoding, data in compressed.items()
+        if len(data) < len(body)
+    )
+    return variants
+
+
+class CachedBody:
+    __slots__ = ("version", "mimetype", "variants", "size")
+
+    def __init__(self, version, mimetype, variants):
+        self.version = version
+        self.mimetype = mimetype
+        self.variants = variants
+        self.size = sum(len(data) for data in variants.values())
+
+    def negotiate(self, accept_encodings):
+        """The best (encoding, body) for a request's Accept-Encoding header."""
+        for encoding in ENCODINGS:
+            if encoding in self.variants and accept_encodings[encoding] > 0:
+                return encoding, self.variants[encoding]
+        return "identity", self.variants["identity"]
+
+
+class ResponseCache:
+    """Bounded LRU cache of CachedBody entries, one per key."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version, build, mimetype="application/json"):
+        """
+        The entry for key if it was built at version, otherwise a new one
+        from build(), which must return the body as bytes.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                return entry
+        # built outside the lock so slow builds don't hold up cache hits;
+        # two threads missing at once both build, and the later one wins
+        entry = CachedBody(version, mimetype, encode(build()))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+            if entry.size <= self.max_bytes:
+                self._entries[key] = entry
+                self.size += entry.size
+                while self.size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size -= evicted.size
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
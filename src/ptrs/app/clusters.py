@@ -0,0 +1,111 @@
+import math
+from collections import defaultdict
+
+"""
+Zoom-level clustering for the map.
+
+For every zoom level from MIN_ZOOM to MAX_ZOOM, reports are
+grouped into square cells a quarter of a map tile wide, and each
+cell keeps a running count, open (unrepaired) count and coordinate
+sums, so its centroid is always sum / count. Stores update the cells
+as reports are added or change status, so a map request only reads
+the cells in view and never regroups reports.
+
+Past MAX_ZOOM the map shows individual potholes instead, for
+viewports no more than MAX_REPORT_SPAN degrees across.
+"""
+
+MIN_ZOOM = 10
+MAX_ZOOM = 16
+CELLS_PER_TILE = 4
+# a zoom 17 viewport is a few hundredths of a degree across,
+# even on a large screen
+MAX_REPORT_SPAN = 0.25
+
+ZOOM_LEVELS = range(MIN_ZOOM, MAX_ZOOM + 1)
+
+
+def cell_size(zoom):
+    """Width of a cluster cell at the given zoom, in degrees."""
+    return 360.0 / (2**zoom) / CELLS_PER_TILE
+
+
+CELL_SIZES = {zoom: cell_size(zoom) for zoom in ZOOM_LEVELS}
+
+
+def cell_for(zoom, lat, lng):
+    size = CELL_SIZES[zoom]
+    return (math.floor(lng / size), math.floor(lat / size))
+
+
+def cell_range(zoom, bbox):
+    """(min_x, min_y, max_x, max_y) of the cells overlapping bbox."""
+    min_x, min_y = cell_for(zoom, bbox[1], bbox[0])
+    max_x, max_y = cell_for(zoom, bbox[3], bbox[2])
+    return (min_x, min_y, max_x, max_y)
+
+
+def cluster_deltas(changes):
+    """
+    Fold (lat, lng, count, open_count) changes into per-cell deltas
+    for every zoom level: {(zoom, x, y): [count, open_count, sum_lat, sum_lng]}.
+
+    A new report is (lat, lng, 1, 1 if open else 0); a report that
+    gets repaired is (lat, lng, 0, -1).
+    """
+    deltas = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    for lat, lng, count, open_count in changes:
+        for zoom, size in CELL_SIZES.items():
+            delta = deltas[(zoom, math.floor(lng / size), math.floor(lat / size))]
+            delta[0] += count
+            delta[1] += open_count
+            delta[2] += lat * count
+            delta[3] += lng * count
+    return deltas
+
+
+def to_cluster(count, open_count, sum_lat, sum_lng):
+    return {
+        "latitude": sum_lat / count,
+        "longitude": sum_lng / count,
+        "count": count,
+        "open": open_count,
+    }
+
+
+class ClusterIndex:
+    """In-memory cluster cells, used by MemoryReportStore."""
+
+    def __init__(self):
+        self._levels = {zoom: {} for zoom in ZOOM_LEVELS}
+
+    def apply(self, deltas):
+        for (zoom, x, y), delta in deltas.items():
+            cells = self._levels[zoom]
+            cell = cells.setdefault((x, y), [0, 0, 0.0, 0.0])
+            for i, value in enumerate(delta):
+                cell[i] += value
+            if cell[0] <= 0:
+                del cells[(x, y)]
+
+    def cells(self, zoom, bbox):
+        """((x, y), [count, open_count, sum_lat, sum_lng]) of the cells in bbox."""
+        cells = self._levels[zoom]
+        min_x, min_y, max_x, max_y = cell_range(zoom, bbox)
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(cells):
+            keys = [
+                key
+                for key in cells
+                if min_x <= key[0] <= max_x and min_y <= key[1] <= max_y
+            ]
+        else:
+            keys = [
+                (x, y)
+                for x in range(min_x, max_x + 1)
+                for y in range(min_y, max_y + 1)
+                if (x, y) in cells
+            ]
+        return [(key, cells[key]) for key in keys]
+
+    def query(self, zoom, bbox):
+        return [to_cluster(*cell) for _, cell in self.cells(zoom, bbox)]
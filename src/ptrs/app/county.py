@@ -0,0 +1,154 @@
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+"""
+Offline county checks for new reports.
+
+CountyBoundary answers "is this point in the county?" from a locally
+stored GeoJSON polygon instead of a geocoder round trip, and
+GeocodeCache remembers the addresses already resolved for nearby
+clicks so the map doesn't have to ask Google for them again.
+
+Addresses in the cache are shown to every user, so they only ever
+come from ReverseGeocoder, the server's own lookup, never from a client.
+"""
+
+GEOCODING_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+DEFAULT_BOUNDARY = os.path.join(
+    os.path.dirname(__file__), "data", "indiana_county.geojson"
+)
+
+
+def _rings(geometry):
+    if geometry["type"] == "Polygon":
+        return geometry["coordinates"]
+    if geometry["type"] == "MultiPolygon":
+        return [ring for polygon in geometry["coordinates"] for ring in polygon]
+    raise ValueError(f"Expected a Polygon or MultiPolygon, got {geometry['type']!r}")
+
+
+class CountyBoundary:
+    """
+    Point-in-polygon test against a county boundary.
+
+    Points outside the precomputed bounding box are rejected right away.
+    Otherwise a ray is cast east from the point, but only against the
+    edges filed under the point's latitude band, so a check looks at a
+    handful of edges instead of the whole outline. Holes and multiple
+    parts follow the even-odd rule.
+    """
+
+    def __init__(self, rings, bands=64):
+        edges = [
+            (lng1, lat1, lng2, lat2)
+            for ring in rings
+            for (lng1, lat1), (lng2, lat2) in zip(ring, ring[1:] + ring[:1])
+            if lat1 != lat2
+        ]
+        lngs = [point[0] for ring in rings for point in ring]
+        lats = [point[1] for ring in rings for point in ring]
+        self.bbox = (min(lngs), min(lats), max(lngs), max(lats))
+        self._band_height = (self.bbox[3] - self.bbox[1]) / bands or 1.0
+        self._bands = [[] for _ in range(bands)]
+        for edge in edges:
+            low, high = sorted((edge[1], edge[3]))
+            for band in range(self._band(low), self._band(high) + 1):
+                self._bands[band].append(edge)
+
+    @classmethod
+    def from_geojson(cls, path):
+        with open(path) as file:
+            data = json.load(file)
+        if data.get("type") == "FeatureCollection":
+            rings = [
+                r for feature in data["features"] for r in _rings(feature["geometry"])
+            ]
+        else:
+            rings = _rings(data.get("geometry", data))
+        # drop GeoJSON's repeated closing point, rings are closed implicitly
+        return cls([ring[:-1] if ring[0] == ring[-1] else ring for ring in rings])
+
+    def _band(self, lat):
+        band = math.floor((lat - self.bbox[1]) / self._band_height)
+        return min(max(band, 0), len(self._bands) - 1)
+
+    def contains(self, lat, lng):
+        west, south, east, north = self.bbox
+        if not (south <= lat <= north and west <= lng <= east):
+            return False
+        inside = False
+        for lng1, lat1, lng2, lat2 in self._bands[self._band(lat)]:
+            if (lat1 > lat) != (lat2 > lat):
+                crossing = lng1 + (lat - lat1) * (lng2 - lng1) / (lat2 - lat1)
+                if lng < crossing:
+                    inside = not inside
+        return inside
+
+
+class GeocodeCache:
+    """
+    Bounded LRU cache of addresses keyed on snapped coordinates.
+
+    Coordinates are rounded to `precision` decimal places (4 is
+    roughly 10 meters), so clicks on nearly the same spot share an entry.
+    """
+
+    def __init__(self, max_size=10_000, precision=4):
+        self.max_size = max_size
+        self.precision = precision
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, lat, lng):
+        return (round(lat, self.precision), round(lng, self.precision))
+
+    def get(self, lat, lng):
+        key = self._key(lat, lng)
+        with self._lock:
+            address = self._entries.get(key)
+            if address is not None:
+                self._entries.move_to_end(key)
+            return address
+
+    def put(self, lat, lng, address):
+        key = self._key(lat, lng)
+        with self._lock:
+            self._entries[key] = address
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ReverseGeocoder:
+    """
+    Looks up the street address of a point with Google's Geocoding API.
+
+    lookup() returns None instead of raising when the service can't be
+    reached or has no address, so a failed lookup only costs the map
+    a geocoder call of its own.
+    """
+
+    def __init__(self, api_key, timeout=5.0):
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def lookup(self, lat, lng):
+        query = urlencode({"latlng": f"{lat},{lng}", "key": self.api_key})
+        try:
+            with urlopen(f"{GEOCODING_URL}?{query}", timeout=self.timeout) as response:
+                body = json.load(response)
+            address = body["results"][0]["formatted_address"]
+        except (OSError, ValueError, KeyError, IndexError, TypeError):
+            # URLError and timeouts are OSErrors, a bad body a ValueError
+            return None
+        # the map shows addresses without the country, like its own geocoder
+        return str(address).removesuffix(", USA")
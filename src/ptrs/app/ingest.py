@@ -0,0 +1,70 @@
+import json
+from datetime import datetime
+
+from ptrs.app.reports import report_from_record
+
+"""
+Bulk import of pothole reports from newline-delimited JSON (NDJSON),
+one report object per line, e.g. from road crews or 311 exports.
+
+Lines are read one at a time and stored in batches, so memory use
+stays flat however large the upload is. A report close enough to an
+existing unrepaired pothole is merged into it instead of duplicated.
+"""
+
+MAX_ERRORS = 100
+# reports further apart than this are never the same pothole
+MAX_MERGE_DISTANCE = 1000.0
+
+
+def parse_merge_distance(value):
+    """A merge distance in meters, from 0 up to MAX_MERGE_DISTANCE."""
+    distance = float(value)
+    if not 0 <= distance <= MAX_MERGE_DISTANCE:
+        raise ValueError(
+            f"merge distance must be between 0 and {MAX_MERGE_DISTANCE:g} meters"
+        )
+    return distance
+
+
+def ingest_ndjson(store, lines, county=None, merge_distance=10.0, batch_size=1000):
+    """
+    Validate and store the reports in an iterable of NDJSON lines.
+
+    Bad lines (invalid JSON, missing coordinates, outside the county)
+    are counted and skipped; the first MAX_ERRORS are reported with
+    their line numbers. Returns a summary dict.
+    """
+    merge_distance = parse_merge_distance(merge_distance)
+    summary = {"inserted": 0, "merged": 0, "rejected": 0, "errors": []}
+    now = datetime.now()
+    batch = []
+
+    def flush():
+        inserted, merged = store.merge_many(batch, merge_distance)
+        summary["inserted"] += inserted
+        summary["merged"] += merged
+        batch.clear()
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            report = report_from_record(json.loads(line), now=now)
+            if county is not None and not county.contains(
+                report.latitude, report.longitude
+            ):
+                raise ValueError("location is not within the county")
+        except (ValueError, RecursionError) as error:
+            # json.loads recurses into nested arrays and objects, so a
+            # line of thousands of brackets runs out of stack
+            summary["rejected"] += 1
+            if len(summary["errors"]) < MAX_ERRORS:
+                summary["errors"].append({"line": number, "error": str(error)})
+            continue
+        batch.append(report)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return summary
@@ -0,0 +1,153 @@
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request
+
+"""
+Opt-in request instrumentation, enabled with the METRICS config value.
+
+Every request's latency and response size, and the time spent
+serializing /data and /analytics responses, are recorded per route
+in histograms and served at /metrics in the Prometheus text exposition
+format.
+
+Each process keeps its own numbers, so under gunicorn every worker
+reports only the requests it handled itself.
+"""
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# the methods recorded under their own name, the rest are "other",
+# so made-up methods can't add series without end
+METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+
+
+def _format_labels(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+
+class Histogram:
+    """Cumulative-bucket histogram over a fixed set of upper bounds."""
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # one slot per bucket plus +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        total = 0
+        bounds = [*map(str, self.buckets), "+Inf"]
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            bucket_labels = _format_labels([*labels, ("le", bound)])
+            yield f"{name}_bucket{{{bucket_labels}}} {total}"
+        yield f"{name}_sum{{{_format_labels(labels)}}} {self.sum}"
+        yield f"{name}_count{{{_format_labels(labels)}}} {total}"
+
+
+class Metrics:
+    """Per-route request metrics, safe to share between threads."""
+
+    FAMILIES = (
+        (
+            "ptrs_request_duration_seconds",
+            "Time from the start of a request to its response.",
+            LATENCY_BUCKETS,
+        ),
+        (
+            "ptrs_response_size_bytes",
+            "Size of response bodies as sent.",
+            SIZE_BUCKETS,
+        ),
+        (
+            "ptrs_serialization_duration_seconds",
+            "Time spent serializing response bodies on response cache misses.",
+            LATENCY_BUCKETS,
+        ),
+    )
+
+    def __init__(self):
+        self._requests = {}
+        self._histograms = {name: {} for name, _, _ in self.FAMILIES}
+        self._lock = threading.Lock()
+
+    def _observe(self, family, labels, value):
+        histograms = self._histograms[family]
+        histogram = histograms.get(labels)
+        if histogram is None:
+            buckets = next(b for name, _, b in self.FAMILIES if name == family)
+            histogram = histograms[labels] = Histogram(buckets)
+        histogram.observe(value)
+
+    def record(self, route, method, status, seconds, size, serialization=None):
+        labels = (("route", route), ("method", method))
+        key = (*labels, ("status", str(status)))
+        with self._lock:
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._observe("ptrs_request_duration_seconds", labels, seconds)
+            if size is not None:
+                self._observe("ptrs_response_size_bytes", labels, size)
+            if serialization is not None:
+                self._observe(
+                    "ptrs_serialization_duration_seconds", labels, serialization
+                )
+
+    def render(self):
+        """All metrics in the Prometheus text format."""
+        lines = [
+            "# HELP ptrs_requests_total Requests handled, by route and status.",
+            "# TYPE ptrs_requests_total counter",
+        ]
+        with self._lock:
+            for labels, count in sorted(self._requests.items()):
+                labels = _format_labels(labels)
+                lines.append(f"ptrs_requests_total{{{labels}}} {count}")
+            for name, description, _ in self.FAMILIES:
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(self._histograms[name].items()):
+                    lines.extend(histogram.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+
+def instrument(app, metrics):
+    """
+    Record every request of app in metrics and serve them at /metrics.
+    Views report serialization time by setting g.serialization_seconds.
+    """
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            # label by URL rule, not path, so stray 404s share one series
+            rule = request.url_rule.rule if request.url_rule else "unmatched"
+            method = request.method if request.method in METHODS else "other"
+            metrics.record(
+                rule,
+                method,
+                response.status_code,
+                time.perf_counter() - started,
+                response.calculate_content_length(),
+                g.pop("serialization_seconds", None),
+            )
+        return response
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        return metrics.render(), 200, {"Content-Type": CONTENT_TYPE}
@@ -0,0 +1,275 @@
+import re
+from datetime import datetime, timedelta
+from enum import IntEnum
+
+"""
+The pothole report model.
+
+Reports are kept as compact Report records: coordinates as floats,
+dates as epoch seconds, size as whole tenths (0-100) and repair status
+as a RepairStatus code. The display strings the map shows (e.g.
+"11:39AM on October 26th 2024") are only produced by Report.to_dict(),
+when a report is serialized.
+"""
+
+REPAIR_WINDOW = timedelta(days=2)
+
+
+class RepairStatus(IntEnum):
+    NOT_REPAIRED = 0
+    IN_PROGRESS = 1
+    REPAIRED = 2
+
+    @property
+    def label(self):
+        return _STATUS_LABELS[self]
+
+    @classmethod
+    def parse(cls, value):
+        """Accept a code (2 or "2"), label ("Repaired") or name ("REPAIRED")."""
+        if isinstance(value, int):
+            return cls(value)
+        text = str(value).strip().casefold()
+        if text.isdigit():
+            return cls(int(text))
+        for status in cls:
+            if text in (status.label.casefold(), status.name.casefold()):
+                return status
+        raise ValueError(f"unknown repair status {value!r}")
+
+
+_STATUS_LABELS = {
+    RepairStatus.NOT_REPAIRED: "Not Repaired",
+    RepairStatus.IN_PROGRESS: "In Progress",
+    RepairStatus.REPAIRED: "Repaired",
+}
+
+
+class Severity(IntEnum):
+    """Size buckets: minor below 4/10, moderate below 7/10, severe from 7/10."""
+
+    MINOR = 0
+    MODERATE = 1
+    SEVERE = 2
+
+    @classmethod
+    def of(cls, size):
+        """Severity of a size in tenths."""
+        if size < 40:
+            return cls.MINOR
+        return cls.MODERATE if size < 70 else cls.SEVERE
+
+    @property
+    def sizes(self):
+        """Inclusive (min, max) range of sizes in tenths."""
+        return ((0, 39), (40, 69), (70, 100))[self]
+
+
+def is_open(status):
+    """Whether a report with this status still needs work."""
+    return status != RepairStatus.REPAIRED
+
+
+def _ordinal(day):
+    if 10 <= day % 100 <= 20:
+        return f"{day}th"
+    return f"{day}" + {1: "st", 2: "nd", 3: "rd"}.get(day % 10, "th")
+
+
+def format_date(when):
+    """Format a date like "October 26th 2024"."""
+    return f"{when:%B} {_ordinal(when.day)} {when.year}"
+
+
+def format_timestamp(when):
+    """Format a datetime like "11:39AM on October 26th 2024"."""
+    hour = when.hour % 12 or 12
+    meridiem = "AM" if when.hour < 12 else "PM"
+    return f"{hour}:{when.minute:02d}{meridiem} on {format_date(when)}"
+
+
+_DISPLAY_DATE = re.compile(
+    r"(?:(\d{1,2}):(\d{2})([AP]M) on )?([A-Za-z]+) (\d{1,2})(?:st|nd|rd|th) (\d{4})$"
+)
+
+
+def to_epoch(value):
+    """
+    Epoch seconds from a number, an ISO 8601 string or one
+    of the display formats above. Raises ValueError otherwise.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            # must also be displayable later on
+            datetime.fromtimestamp(value)
+            return int(value)
+        except (OverflowError, OSError) as error:
+            raise ValueError(f"invalid timestamp {value!r}") from error
+    text = str(value).strip()
+    match = _DISPLAY_DATE.match(text)
+    if match is None:
+        return int(datetime.fromisoformat(text).timestamp())
+    hour, minute, meridiem, month, day, year = match.groups()
+    when = datetime.strptime(f"{month} {day} {year}", "%B %d %Y")
+    if hour is not None:
+        hour = int(hour) % 12 + (12 if meridiem == "PM" else 0)
+        when = when.replace(hour=hour, minute=int(minute))
+    return int(when.timestamp())
+
+
+class Report:
+    """
+    One pothole report. id and seq are assigned by the store:
+    seq is the report's change sequence number (see ptrs.app.storage).
+    """
+
+    __slots__ = (
+        "id",
+        "latitude",
+        "longitude",
+        "address",
+        "size",
+        "location",
+        "other",
+        "status",
+        "reported_at",
+        "expected_at",
+        "report_count",
+        "seq",
+    )
+
+    def __init__(
+        self,
+        latitude,
+        longitude,
+        address="",
+        size=0,
+        location="",
+        other="",
+        status=RepairStatus.NOT_REPAIRED,
+        reported_at=0,
+        expected_at=0,
+        report_count=1,
+        id=None,
+        seq=0,
+    ):
+        self.id = id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.address = address
+        self.size = size
+        self.location = location
+        self.other = other
+        self.status = status
+        self.reported_at = reported_at
+        self.expected_at = expected_at
+        self.report_count = report_count
+        self.seq = seq
+
+    def __repr__(self):
+        return f"<Report {self.id} ({self.latitude}, {self.longitude})>"
+
+    def to_dict(self):
+        """The report as the map frontend expects it."""
+        return {
+            "id": self.id,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "address": self.address,
+            "size": self.size / 10,
+            "location": self.location,
+            "other": self.other,
+            "repairStatus": _STATUS_LABELS[self.status],
+            "reportDate": format_timestamp(datetime.fromtimestamp(self.reported_at)),
+            "expectedCompletion": format_date(datetime.fromtimestamp(self.expected_at)),
+            "reportCount": self.report_count,
+            "seq": self.seq,
+        }
+
+
+class ReportFilter:
+    """
+    Attribute filters for report queries, in stored units:
+    a set of RepairStatus codes, sizes in tenths and
+    epoch seconds, each bound inclusive. None means "any".
+    """
+
+    __slots__ = (
+        "statuses",
+        "min_size",
+        "max_size",
+        "reported_after",
+        "reported_before",
+    )
+
+    def __init__(
+        self,
+        statuses=None,
+        min_size=None,
+        max_size=None,
+        reported_after=None,
+        reported_before=None,
+    ):
+        self.statuses = statuses
+        self.min_size = min_size
+        self.max_size = max_size
+        self.reported_after = reported_after
+        self.reported_before = reported_before
+
+    def __bool__(self):
+        return any(getattr(self, name) is not None for name in self.__slots__)
+
+
+def new_report(latitude, longitude, address, size, location="", other="", now=None):
+    """
+    Build a freshly submitted report, size on the 0-10 scale.
+    New reports start out unrepaired and are
+    expected to be fixed within REPAIR_WINDOW.
+    Raises ValueError (or OverflowError) for unusable values.
+    """
+    now = now or datetime.now()
+    size = round(float(size) * 10)
+    if not 0 <= size <= 100:
+        raise ValueError("size must be between 0 and 10")
+    return Report(
+        latitude=float(latitude),
+        longitude=float(longitude),
+        address=str(address or ""),
+        size=size,
+        location=str(location or ""),
+        other=str(other or ""),
+        reported_at=int(now.timestamp()),
+        expected_at=int((now + REPAIR_WINDOW).timestamp()),
+    )
+
+
+def report_from_record(record, now=None):
+    """
+    Build a report from an imported record (e.g. one NDJSON line).
+    Only latitude and longitude are required; size is on the stored
+    0-10 scale and missing dates are filled in as for a new report.
+    Raises ValueError if the record isn't usable.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("a record must be a JSON object")
+    try:
+        report = new_report(
+            latitude=record["latitude"],
+            longitude=record["longitude"],
+            address=record.get("address"),
+            size=record.get("size", 0),
+            location=record.get("location"),
+            other=record.get("other"),
+            now=now,
+        )
+    except KeyError as error:
+        raise ValueError(f"missing {error.args[0]!r}") from None
+    except (TypeError, OverflowError) as error:
+        raise ValueError(str(error)) from None
+    if record.get("repairStatus"):
+        report.status = RepairStatus.parse(record["repairStatus"])
+    if record.get("reportDate"):
+        report.reported_at = to_epoch(record["reportDate"])
+    if record.get("expectedCompletion"):
+        report.expected_at = to_epoch(record["expectedCompletion"])
+    return report
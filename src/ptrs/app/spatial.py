@@ -0,0 +1,110 @@
+import math
+from collections import defaultdict
+
+"""
+Geometry helpers and the in-memory spatial index used by the map queries.
+
+Bounding boxes are (west, south, east, north) tuples in degrees,
+the same order the /data bbox parameter uses.
+"""
+
+EARTH_RADIUS_M = 6_371_008.8
+
+WORLD = (-180.0, -90.0, 180.0, 90.0)
+
+
+def parse_bbox(text):
+    """Parse "west,south,east,north" into a bounding box tuple."""
+    west, south, east, north = (float(value) for value in text.split(","))
+    if not (-90 <= south <= north <= 90 and -180 <= west <= east <= 180):
+        raise ValueError(f"Invalid bounding box: {text!r}")
+    return (west, south, east, north)
+
+
+def parse_point(lat, lng):
+    """Parse a latitude and longitude, rejecting anything off the globe."""
+    lat, lng = float(lat), float(lng)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f"Invalid point: {lat}, {lng}")
+    return lat, lng
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance between two points in meters."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_bbox(lat, lng, radius_m):
+    """Smallest bounding box that contains a circle around (lat, lng)."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    coslat = math.cos(math.radians(lat))
+    dlng = 180.0 if coslat < 1e-9 else min(180.0, dlat / coslat)
+    return (
+        max(-180.0, lng - dlng),
+        max(-90.0, lat - dlat),
+        min(180.0, lng + dlng),
+        min(90.0, lat + dlat),
+    )
+
+
+def intersect_bbox(a, b):
+    """Intersection of two bounding boxes, or None if they don't overlap."""
+    west, south = max(a[0], b[0]), max(a[1], b[1])
+    east, north = min(a[2], b[2]), min(a[3], b[3])
+    if west > east or south > north:
+        return None
+    return (west, south, east, north)
+
+
+def in_bbox(lat, lng, bbox):
+    return bbox[1] <= lat <= bbox[3] and bbox[0] <= lng <= bbox[2]
+
+
+class GridIndex:
+    """
+    Uniform grid of point ids, bucketed by cell_size degree cells.
+
+    A query only visits the cells overlapping its bounding box (or,
+    for very large boxes, only the occupied cells), so its cost follows
+    the number of nearby points rather than the total number indexed.
+    """
+
+    def __init__(self, cell_size=0.01):
+        self.cell_size = cell_size
+        self._cells = defaultdict(list)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lng / self.cell_size), math.floor(lat / self.cell_size))
+
+    def insert(self, report_id, lat, lng):
+        self._cells[self._cell(lat, lng)].append((report_id, lat, lng))
+
+    def search(self, bbox):
+        """Yield (id, lat, lng) for every indexed point inside bbox."""
+        min_x, min_y = self._cell(bbox[1], bbox[0])
+        max_x, max_y = self._cell(bbox[3], bbox[2])
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self._cells):
+            cells = [
+                cell
+                for cell in self._cells
+                if min_x <= cell[0] <= max_x and min_y <= cell[1] <= max_y
+            ]
+        else:
+            cells = [
+                (x, y)
+                for x in range(min_x, max_x + 1)
+                for y in range(min_y, max_y + 1)
+                if (x, y) in self._cells
+            ]
+        for cell in cells:
+            for entry in self._cells[cell]:
+                if in_bbox(entry[1], entry[2], bbox):
+                    yield entry
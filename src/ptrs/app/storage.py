@@ -0,0 +1,914 @@
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from operator import attrgetter, itemgetter
+
+from ptrs.app.analytics import day_of, report_stat, stat_deltas
+from ptrs.app.clusters import ClusterIndex, cell_range, cluster_deltas, to_cluster
+from ptrs.app.reports import RepairStatus, Report, Severity, is_open
+from ptrs.app.spatial import GridIndex, distance_m, intersect_bbox, radius_bbox
+
+"""
+Storage backends for pothole reports.
+
+Every backend implements the ReportStore interface,
+so create_app() can swap between them through the
+STORAGE config value:
+
+- "sqlite" (default): an embedded SQLite database in WAL mode.
+  Every gunicorn worker (and every thread within it) reuses its own
+  connection, so all workers see the same reports and survive restarts.
+- "memory": process-local columns, meant for tests and quick demos.
+
+Stores take and return ptrs.app.reports.Report records and fill in
+their id and seq. seq is a change sequence number: every insert or
+update gives the report the next one, so clients can ask for only
+what changed since the last seq they saw.
+"""
+
+
+def _at(*when):
+    return int(datetime(*when).timestamp())
+
+
+SEED_REPORTS = [
+    Report(
+        latitude=40.61784839360533,
+        longitude=-79.14349968544316,
+        address="310 Locust St, Indiana, PA 15701",
+        size=50,
+        location="Turning lane",
+        reported_at=_at(2024, 10, 26, 11, 39),
+        expected_at=_at(2024, 10, 28),
+    ),
+    Report(
+        latitude=40.78190387919964,
+        longitude=-79.05321749721166,
+        address="9819 Rte 119 Hwy N, Marion Center, PA 0",
+        size=80,
+        location="By parking",
+        reported_at=_at(2024, 10, 26, 19, 23),
+        expected_at=_at(2024, 10, 28),
+    ),
+    Report(
+        latitude=40.62053120537463,
+        longitude=-78.91648685182243,
+        address="6424 PA-403, Homer City, PA 15748",
+        size=20,
+        reported_at=_at(2024, 10, 27, 0, 5),
+        expected_at=_at(2024, 10, 28),
+    ),
+    Report(
+        latitude=40.53661477640323,
+        longitude=-79.06485400700325,
+        address="5533 Rte 422 Hwy W, Indiana, PA 15701",
+        size=70,
+        reported_at=_at(2024, 10, 27, 17, 17),
+        expected_at=_at(2024, 10, 28),
+    ),
+    Report(
+        latitude=40.66118746305543,
+        longitude=-79.0205031224644,
+        address="1385 Dixon Rd, Clymer, PA 15728",
+        size=10,
+        reported_at=_at(2024, 10, 27, 20, 21),
+        expected_at=_at(2024, 10, 28),
+    ),
+]
+
+
+class ReportStore:
+    """Interface shared by all report storage backends."""
+
+    def add(self, report):
+        """Atomically store a single report and return its id."""
+        raise NotImplementedError
+
+    def add_many(self, reports):
+        """Store an iterable of reports, committing in batches. Returns the count."""
+        raise NotImplementedError
+
+    def merge_many(self, reports, merge_distance):
+        """
+        Store a batch of reports in one transaction, except that a report
+        within merge_distance meters of an unrepaired one (stored earlier
+        or earlier in the batch) is merged into the nearest such report:
+        its report_count goes up and it keeps the larger size.
+        Returns (inserted, merged) counts.
+        """
+        raise NotImplementedError
+
+    def all(self):
+        """Return every stored report."""
+        return self._search(None)
+
+    def query(self, bbox=None, near=None, limit=None, filters=None):
+        """
+        Return at most limit reports inside bbox and/or within
+        near=(lat, lng, radius_m) that match a ReportFilter.
+        Radius matches are ordered nearest first, everything
+        else by report id.
+        """
+        if near is None:
+            return self._search(bbox, limit, filters)
+        lat, lng, radius = near
+        circle = radius_bbox(lat, lng, radius)
+        bbox = circle if bbox is None else intersect_bbox(bbox, circle)
+        if bbox is None:
+            return []
+        matches = []
+        for report in self._search(bbox, filters=filters):
+            distance = distance_m(lat, lng, report.latitude, report.longitude)
+            if distance <= radius:
+                matches.append((distance, report))
+        matches.sort(key=itemgetter(0))
+        return [report for _, report in matches[:limit]]
+
+    def _search(self, bbox, limit=None, filters=None):
+        """
+        Reports inside bbox (all reports if None) matching filters,
+        in id order, up to limit.
+        """
+        raise NotImplementedError
+
+    def clusters(self, zoom, bbox):
+        """
+        Precomputed clusters overlapping bbox at a zoom level between
+        clusters.MIN_ZOOM and clusters.MAX_ZOOM, as dicts with a
+        centroid latitude/longitude, a count and an open count.
+        """
+        raise NotImplementedError
+
+    def density(self, zoom, bbox):
+        """
+        (x, y, count, open_count) of the non-empty cluster cells overlapping
+        bbox at a zoom level, ordered by y, then x (see ptrs.app.analytics).
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """Report counts as {(RepairStatus, Severity): count}."""
+        raise NotImplementedError
+
+    def repairs(self, since):
+        """
+        (count, total seconds from report to repair) of the repairs
+        made from the day of the epoch timestamp since onwards.
+        """
+        raise NotImplementedError
+
+    def update_status(self, report_id, status):
+        """Change a report's RepairStatus. Returns False if there is no such report."""
+        raise NotImplementedError
+
+    def version(self):
+        """The latest change sequence number, 0 for an empty store."""
+        raise NotImplementedError
+
+    def changes_since(self, cursor, limit=None):
+        """
+        Reports inserted or updated after the change sequence number
+        cursor, oldest change first, up to limit. Returns the reports
+        and the cursor to pass next time.
+        """
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    @staticmethod
+    def _nearest(candidates, lat, lng, merge_distance):
+        """Id of the closest (id, lat, lng) candidate within merge_distance, or None."""
+        best, best_distance = None, merge_distance
+        for report_id, other_lat, other_lng in candidates:
+            distance = distance_m(lat, lng, other_lat, other_lng)
+            if distance <= best_distance:
+                best, best_distance = report_id, distance
+        return best
+
+    def seed(self, reports):
+        """Store reports only if the store is currently empty."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def _cluster_change(report):
+    """The cluster change caused by storing a new report."""
+    return (report.latitude, report.longitude, 1, 1 if is_open(report.status) else 0)
+
+
+def _status_change(latitude, longitude, old_status, status):
+    """The cluster change caused by a status update, or None if nothing changes."""
+    was_open = is_open(old_status)
+    if was_open == is_open(status):
+        return None
+    return (latitude, longitude, 0, -1 if was_open else 1)
+
+
+def _repair_time(old_status, status, reported_at, now):
+    """Seconds a report took to repair if a status update repairs it, else None."""
+    if is_open(old_status) and not is_open(status):
+        return max(now - reported_at, 0)
+    return None
+
+
+class MemoryReportStore(ReportStore):
+    """
+    Process-local store. Data is not shared between workers or kept across restarts.
+
+    Reports are kept column by column in typed arrays (row i is report
+    id i + 1), so filters run as one tight pass per column instead of
+    poking at one object per report.
+    """
+
+    def __init__(self, cell_size=0.01):
+        self._latitude = array("d")
+        self._longitude = array("d")
+        self._size = array("B")
+        self._status = array("B")
+        self._reported_at = array("q")
+        self._expected_at = array("q")
+        self._report_count = array("L")
+        self._seq = array("q")
+        self._address = []
+        self._location = []
+        self._other = []
+        # in the order of _row_values()
+        self._columns = (
+            self._latitude,
+            self._longitude,
+            self._size,
+            self._status,
+            self._reported_at,
+            self._expected_at,
+            self._report_count,
+            self._seq,
+            self._address,
+            self._location,
+            self._other,
+        )
+        self._index = GridIndex(cell_size)
+        self._clusters = ClusterIndex()
+        self._stats = defaultdict(int)
+        # epoch day -> [repairs, total seconds to repair]
+        self._repair_days = defaultdict(lambda: [0, 0])
+        # (seq, id) of every change in order; entries are
+        # stale once a later change to the same report exists
+        self._change_seqs = array("q")
+        self._change_ids = array("q")
+        self._lock = threading.Lock()
+
+    def _record_change(self, row):
+        seq = len(self._change_seqs) + 1
+        self._seq[row] = seq
+        self._change_seqs.append(seq)
+        self._change_ids.append(row + 1)
+
+    def _report(self, row):
+        return Report(
+            id=row + 1,
+            latitude=self._latitude[row],
+            longitude=self._longitude[row],
+            address=self._address[row],
+            size=self._size[row],
+            location=self._location[row],
+            other=self._other[row],
+            status=RepairStatus(self._status[row]),
+            reported_at=self._reported_at[row],
+            expected_at=self._expected_at[row],
+            report_count=self._report_count[row],
+            seq=self._seq[row],
+        )
+
+    @staticmethod
+    def _row_values(report):
+        return (
+            report.latitude,
+            report.longitude,
+            report.size,
+            report.status,
+            report.reported_at,
+            report.expected_at,
+            report.report_count,
+            0,
+            report.address,
+            report.location,
+            report.other,
+        )
+
+    def _insert(self, report):
+        row = len(self._latitude)
+        try:
+            for column, value in zip(self._columns, self._row_values(report)):
+                column.append(value)
+        except (TypeError, ValueError, OverflowError):
+            # a value that doesn't fit its column must not leave
+            # the columns it was already appended to a row ahead
+            for column in self._columns:
+                del column[row:]
+            raise
+        self._record_change(row)
+        self._index.insert(row + 1, report.latitude, report.longitude)
+        self._clusters.apply(cluster_deltas([_cluster_change(report)]))
+        self._apply_stats([report_stat(report)])
+        return row + 1
+
+    def _apply_stats(self, changes):
+        for key, delta in stat_deltas(changes).items():
+            self._stats[key] += delta
+
+    def add(self, report):
+        with self._lock:
+            return self._insert(report)
+
+    def add_many(self, reports):
+        with self._lock:
+            return len([self._insert(report) for report in reports])
+
+    def merge_many(self, reports, merge_distance):
+        inserted = merged = 0
+        repaired = RepairStatus.REPAIRED
+        with self._lock:
+            for report in reports:
+                lat, lng = report.latitude, report.longitude
+                candidates = (
+                    entry
+                    for entry in self._index.search(
+                        radius_bbox(lat, lng, merge_distance)
+                    )
+                    if self._status[entry[0] - 1] != repaired
+                )
+                match = self._nearest(candidates, lat, lng, merge_distance)
+                if match is None:
+                    self._insert(report)
+                    inserted += 1
+                else:
+                    row = match - 1
+                    old_size, size = self._size[row], max(self._size[row], report.size)
+                    self._report_count[row] += 1
+                    self._size[row] = size
+                    self._record_change(row)
+                    status = self._status[row]
+                    self._apply_stats([(status, old_size, -1), (status, size, 1)])
+                    merged += 1
+        return inserted, merged
+
+    def _filter_rows(self, rows, filters):
+        # one pass per filtered column, each narrowing the row list
+        if filters.statuses is not None:
+            column, wanted = self._status, set(filters.statuses)
+            rows = [row for row in rows if column[row] in wanted]
+        if filters.min_size is not None:
+            column, bound = self._size, filters.min_size
+            rows = [row for row in rows if column[row] >= bound]
+        if filters.max_size is not None:
+            column, bound = self._size, filters.max_size
+            rows = [row for row in rows if column[row] <= bound]
+        if filters.reported_after is not None:
+            column, bound = self._reported_at, filters.reported_after
+            rows = [row for row in rows if column[row] >= bound]
+        if filters.reported_before is not None:
+            column, bound = self._reported_at, filters.reported_before
+            rows = [row for row in rows if column[row] <= bound]
+        return rows
+
+    def _search(self, bbox, limit=None, filters=None):
+        with self._lock:
+            if bbox is None:
+                rows = range(len(self._latitude))
+            else:
+                rows = sorted(entry[0] - 1 for entry in self._index.search(bbox))
+            if filters:
+                rows = self._filter_rows(rows, filters)
+            return [self._report(row) for row in rows[:limit]]
+
+    def clusters(self, zoom, bbox):
+        with self._lock:
+            return self._clusters.query(zoom, bbox)
+
+    def density(self, zoom, bbox):
+        with self._lock:
+            cells = self._clusters.cells(zoom, bbox)
+        cells = [(x, y, cell[0], cell[1]) for (x, y), cell in cells]
+        cells.sort(key=itemgetter(1, 0))
+        return cells
+
+    def stats(self):
+        with self._lock:
+            return {key: count for key, count in self._stats.items() if count}
+
+    def repairs(self, since):
+        first = day_of(since)
+        with self._lock:
+            days = [v for day, v in self._repair_days.items() if day >= first]
+        return sum(v[0] for v in days), sum(v[1] for v in days)
+
+    def update_status(self, report_id, status):
+        with self._lock:
+            if not 1 <= report_id <= len(self._latitude):
+                return False
+            row = report_id - 1
+            old_status, size = self._status[row], self._size[row]
+            change = _status_change(
+                self._latitude[row], self._longitude[row], old_status, status
+            )
+            self._status[row] = status
+            self._record_change(row)
+            if change is not None:
+                self._clusters.apply(cluster_deltas([change]))
+            self._apply_stats([(old_status, size, -1), (status, size, 1)])
+            now = int(time.time())
+            seconds = _repair_time(old_status, status, self._reported_at[row], now)
+            if seconds is not None:
+                repairs = self._repair_days[day_of(now)]
+                repairs[0] += 1
+                repairs[1] += seconds
+            return True
+
+    def version(self):
+        return len(self._change_seqs)
+
+    def changes_since(self, cursor, limit=None):
+        with self._lock:
+            reports = []
+            for i in range(bisect_right(self._change_seqs, cursor), self.version()):
+                if limit is not None and len(reports) >= limit:
+                    break
+                row = self._change_ids[i] - 1
+                if self._seq[row] == self._change_seqs[i]:
+                    reports.append(self._report(row))
+            return reports, reports[-1].seq if reports else cursor
+
+    def count(self):
+        return len(self._latitude)
+
+    def seed(self, reports):
+        with self._lock:
+            if not self._latitude:
+                for report in reports:
+                    self._insert(report)
+
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS reports (
+        id INTEGER PRIMARY KEY,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        address TEXT NOT NULL DEFAULT '',
+        size INTEGER NOT NULL DEFAULT 0 CHECK (size BETWEEN 0 AND 100),
+        location TEXT NOT NULL DEFAULT '',
+        other TEXT NOT NULL DEFAULT '',
+        status INTEGER NOT NULL DEFAULT 0 CHECK (status BETWEEN 0 AND 2),
+        reported_at INTEGER NOT NULL,
+        expected_at INTEGER NOT NULL,
+        report_count INTEGER NOT NULL DEFAULT 1,
+        seq INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS reports_seq ON reports (seq)",
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS report_index USING rtree(
+        id, min_lat, max_lat, min_lng, max_lng
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS report_index_insert AFTER INSERT ON reports BEGIN
+        INSERT INTO report_index
+        VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS report_index_update
+    AFTER UPDATE OF latitude, longitude ON reports BEGIN
+        UPDATE report_index
+        SET min_lat = new.latitude, max_lat = new.latitude,
+            min_lng = new.longitude, max_lng = new.longitude
+        WHERE id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS report_index_delete AFTER DELETE ON reports BEGIN
+        DELETE FROM report_index WHERE id = old.id;
+    END
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS clusters (
+        zoom INTEGER NOT NULL,
+        x INTEGER NOT NULL,
+        y INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        open_count INTEGER NOT NULL,
+        sum_lat REAL NOT NULL,
+        sum_lng REAL NOT NULL,
+        PRIMARY KEY (zoom, x, y)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS report_stats (
+        status INTEGER NOT NULL,
+        severity INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (status, severity)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS repair_days (
+        day INTEGER PRIMARY KEY,
+        count INTEGER NOT NULL,
+        total_seconds INTEGER NOT NULL
+    )
+    """,
+)
+
+# statements are kept as constants so sqlite3's per-connection
+# statement cache hands back the same prepared statement every time
+INSERT_REPORT = """
+INSERT INTO reports (
+    latitude, longitude, address, size, location, other,
+    status, reported_at, expected_at, report_count, seq
+) VALUES (
+    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+    (SELECT COALESCE(MAX(seq), 0) + 1 FROM reports)
+)
+"""
+
+REPORT_COLUMNS = """
+r.id, r.latitude, r.longitude, r.address, r.size, r.location, r.other,
+r.status, r.reported_at, r.expected_at, r.report_count, r.seq
+"""
+
+SELECT_REPORTS = f"""
+SELECT {REPORT_COLUMNS} FROM reports AS r
+WHERE {{where}} ORDER BY r.id LIMIT :limit
+"""
+
+# the R*Tree keeps 32-bit bounds rounded outwards,
+# so exact coordinates are re-checked on the reports table
+SELECT_REPORTS_IN_BBOX = f"""
+SELECT {REPORT_COLUMNS}
+FROM report_index AS i JOIN reports AS r ON r.id = i.id
+WHERE i.max_lng >= :west AND i.min_lng <= :east
+  AND i.max_lat >= :south AND i.min_lat <= :north
+  AND r.longitude BETWEEN :west AND :east
+  AND r.latitude BETWEEN :south AND :north
+  AND {{where}}
+ORDER BY r.id LIMIT :limit
+"""
+
+COUNT_REPORTS = "SELECT COUNT(*) FROM reports"
+
+SELECT_REPORT_STATE = """
+SELECT latitude, longitude, status, size, reported_at FROM reports WHERE id = ?
+"""
+
+UPDATE_STATUS = """
+UPDATE reports
+SET status = ?, seq = (SELECT MAX(seq) + 1 FROM reports)
+WHERE id = ?
+"""
+
+SELECT_OPEN_NEARBY = """
+SELECT r.id, r.latitude, r.longitude
+FROM report_index AS i JOIN reports AS r ON r.id = i.id
+WHERE i.max_lng >= ? AND i.min_lng <= ? AND i.max_lat >= ? AND i.min_lat <= ?
+  AND r.status != ?
+"""
+
+MERGE_REPORT = """
+UPDATE reports
+SET report_count = report_count + 1,
+    size = MAX(size, ?),
+    seq = (SELECT MAX(seq) + 1 FROM reports)
+WHERE id = ?
+"""
+
+SELECT_VERSION = "SELECT COALESCE(MAX(seq), 0) FROM reports"
+
+SELECT_CHANGES = f"""
+SELECT {REPORT_COLUMNS} FROM reports AS r
+WHERE r.seq > ? ORDER BY r.seq LIMIT ?
+"""
+
+UPSERT_CLUSTER = """
+INSERT INTO clusters (zoom, x, y, count, open_count, sum_lat, sum_lng)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (zoom, x, y) DO UPDATE SET
+    count = count + excluded.count,
+    open_count = open_count + excluded.open_count,
+    sum_lat = sum_lat + excluded.sum_lat,
+    sum_lng = sum_lng + excluded.sum_lng
+"""
+
+SELECT_CLUSTERS = """
+SELECT count, open_count, sum_lat, sum_lng FROM clusters
+WHERE zoom = ? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ? AND count > 0
+"""
+
+SELECT_DENSITY = """
+SELECT x, y, count, open_count FROM clusters
+WHERE zoom = ? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ? AND count > 0
+ORDER BY y, x
+"""
+
+UPSERT_STAT = """
+INSERT INTO report_stats (status, severity, count) VALUES (?, ?, ?)
+ON CONFLICT (status, severity) DO UPDATE SET count = count + excluded.count
+"""
+
+SELECT_STATS = "SELECT status, severity, count FROM report_stats WHERE count != 0"
+
+UPSERT_REPAIR_DAY = """
+INSERT INTO repair_days (day, count, total_seconds) VALUES (?, 1, ?)
+ON CONFLICT (day) DO UPDATE SET
+    count = count + 1,
+    total_seconds = total_seconds + excluded.total_seconds
+"""
+
+SELECT_REPAIRS = """
+SELECT COALESCE(SUM(count), 0), COALESCE(SUM(total_seconds), 0)
+FROM repair_days WHERE day >= ?
+"""
+
+_FIELD_ORDER = attrgetter(
+    "latitude",
+    "longitude",
+    "address",
+    "size",
+    "location",
+    "other",
+    "status",
+    "reported_at",
+    "expected_at",
+    "report_count",
+)
+
+
+def _row_params(report):
+    return _FIELD_ORDER(report)
+
+
+def _row_to_report(row):
+    return Report(
+        id=row[0],
+        latitude=row[1],
+        longitude=row[2],
+        address=row[3],
+        size=row[4],
+        location=row[5],
+        other=row[6],
+        status=RepairStatus(row[7]),
+        reported_at=row[8],
+        expected_at=row[9],
+        report_count=row[10],
+        seq=row[11],
+    )
+
+
+def _filter_sql(filters):
+    """A WHERE clause (with named parameters) for a ReportFilter."""
+    clauses = ["1"]
+    params = {}
+    if filters:
+        if filters.statuses is not None:
+            names = []
+            for i, status in enumerate(sorted(filters.statuses)):
+                names.append(f":status{i}")
+                params[f"status{i}"] = int(status)
+            clauses.append(f"r.status IN ({', '.join(names)})")
+        for name, clause in (
+            ("min_size", "r.size >= :min_size"),
+            ("max_size", "r.size <= :max_size"),
+            ("reported_after", "r.reported_at >= :reported_after"),
+            ("reported_before", "r.reported_at <= :reported_before"),
+        ):
+            if getattr(filters, name) is not None:
+                clauses.append(clause)
+                params[name] = getattr(filters, name)
+    return " AND ".join(clauses), params
+
+
+class SQLiteReportStore(ReportStore):
+    """
+    Embedded SQLite store shared by every worker process.
+
+    WAL mode lets readers keep going while a submission is being
+    written, and each thread of each worker process lazily opens
+    one connection that is reused for the rest of its life.
+    """
+
+    def __init__(self, path, batch_size=1000, timeout=5.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._transaction() as connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+
+    def _connection(self):
+        # a connection must never cross a fork, so it is keyed by pid as
+        # well as by thread (gunicorn --preload forks after create_app())
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                isolation_level=None,
+                cached_statements=64,
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent
+        # writers queue on busy_timeout instead of failing mid-transaction
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _apply_clusters(self, connection, changes):
+        connection.executemany(
+            UPSERT_CLUSTER,
+            (key + tuple(delta) for key, delta in cluster_deltas(changes).items()),
+        )
+
+    def _apply_stats(self, connection, changes):
+        connection.executemany(
+            UPSERT_STAT,
+            (
+                (int(status), int(severity), delta)
+                for (status, severity), delta in stat_deltas(changes).items()
+                if delta
+            ),
+        )
+
+    def _insert_rows(self, connection, reports):
+        connection.executemany(INSERT_REPORT, map(_row_params, reports))
+        self._apply_clusters(connection, map(_cluster_change, reports))
+        self._apply_stats(connection, map(report_stat, reports))
+
+    def add(self, report):
+        with self._transaction() as connection:
+            report_id = connection.execute(INSERT_REPORT, _row_params(report)).lastrowid
+            self._apply_clusters(connection, [_cluster_change(report)])
+            self._apply_stats(connection, [report_stat(report)])
+            return report_id
+
+    def add_many(self, reports):
+        total = 0
+        batch = []
+        for report in reports:
+            batch.append(report)
+            if len(batch) >= self.batch_size:
+                total += self._insert_batch(batch)
+                batch = []
+        if batch:
+            total += self._insert_batch(batch)
+        return total
+
+    def _insert_batch(self, batch):
+        with self._transaction() as connection:
+            self._insert_rows(connection, batch)
+        return len(batch)
+
+    def merge_many(self, reports, merge_distance):
+        inserted = []
+        merged = 0
+        stat_changes = []
+        repaired = int(RepairStatus.REPAIRED)
+        with self._transaction() as connection:
+            for report in reports:
+                lat, lng = report.latitude, report.longitude
+                west, south, east, north = radius_bbox(lat, lng, merge_distance)
+                candidates = connection.execute(
+                    SELECT_OPEN_NEARBY, (west, east, south, north, repaired)
+                )
+                match = self._nearest(candidates, lat, lng, merge_distance)
+                if match is None:
+                    # rows go in one by one so later rows in the
+                    # batch can be merged into earlier ones
+                    connection.execute(INSERT_REPORT, _row_params(report))
+                    inserted.append(report)
+                else:
+                    state = connection.execute(SELECT_REPORT_STATE, (match,)).fetchone()
+                    status, old_size = state[2], state[3]
+                    connection.execute(MERGE_REPORT, (report.size, match))
+                    size = max(old_size, report.size)
+                    stat_changes += [(status, old_size, -1), (status, size, 1)]
+                    merged += 1
+            self._apply_clusters(connection, map(_cluster_change, inserted))
+            stat_changes.extend(map(report_stat, inserted))
+            self._apply_stats(connection, stat_changes)
+        return len(inserted), merged
+
+    def _search(self, bbox, limit=None, filters=None):
+        where, params = _filter_sql(filters)
+        # a negative LIMIT means no limit to SQLite
+        params["limit"] = -1 if limit is None else limit
+        if bbox is None:
+            sql = SELECT_REPORTS.format(where=where)
+        else:
+            sql = SELECT_REPORTS_IN_BBOX.format(where=where)
+            params.update(zip(("west", "south", "east", "north"), bbox))
+        rows = self._connection().execute(sql, params)
+        return [_row_to_report(row) for row in rows]
+
+    def clusters(self, zoom, bbox):
+        min_x, min_y, max_x, max_y = cell_range(zoom, bbox)
+        rows = self._connection().execute(
+            SELECT_CLUSTERS, (zoom, min_x, max_x, min_y, max_y)
+        )
+        return [to_cluster(*row) for row in rows]
+
+    def density(self, zoom, bbox):
+        min_x, min_y, max_x, max_y = cell_range(zoom, bbox)
+        rows = self._connection().execute(
+            SELECT_DENSITY, (zoom, min_x, max_x, min_y, max_y)
+        )
+        return rows.fetchall()
+
+    def stats(self):
+        rows = self._connection().execute(SELECT_STATS)
+        return {
+            (RepairStatus(status), Severity(severity)): count
+            for status, severity, count in rows
+        }
+
+    def repairs(self, since):
+        row = self._connection().execute(SELECT_REPAIRS, (day_of(since),)).fetchone()
+        return tuple(row)
+
+    def update_status(self, report_id, status):
+        with self._transaction() as connection:
+            row = connection.execute(SELECT_REPORT_STATE, (report_id,)).fetchone()
+            if row is None:
+                return False
+            latitude, longitude, old_status, size, reported_at = row
+            connection.execute(UPDATE_STATUS, (int(status), report_id))
+            change = _status_change(latitude, longitude, old_status, status)
+            if change is not None:
+                self._apply_clusters(connection, [change])
+            self._apply_stats(connection, [(old_status, size, -1), (status, size, 1)])
+            now = int(time.time())
+            seconds = _repair_time(old_status, status, reported_at, now)
+            if seconds is not None:
+                connection.execute(UPSERT_REPAIR_DAY, (day_of(now), seconds))
+            return True
+
+    def version(self):
+        return self._connection().execute(SELECT_VERSION).fetchone()[0]
+
+    def changes_since(self, cursor, limit=None):
+        rows = self._connection().execute(
+            SELECT_CHANGES, (cursor, -1 if limit is None else limit)
+        )
+        reports = [_row_to_report(row) for row in rows]
+        return reports, reports[-1].seq if reports else cursor
+
+    def count(self):
+        return self._connection().execute(COUNT_REPORTS).fetchone()[0]
+
+    def seed(self, reports):
+        # checked inside the write lock so that workers starting
+        # at the same time don't each insert the seed data
+        with self._transaction() as connection:
+            if connection.execute(COUNT_REPORTS).fetchone()[0] == 0:
+                self._insert_rows(connection, list(reports))
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def create_store(config):
+    """Build the report store selected by an app's config."""
+    backend = config.get("STORAGE", "sqlite")
+    if backend == "memory":
+        return MemoryReportStore()
+    if backend == "sqlite":
+        return SQLiteReportStore(
+            config["DATABASE"], batch_size=config.get("DATABASE_BATCH_SIZE", 1000)
+        )
+    raise ValueError(f"Unknown STORAGE backend: {backend!r}")
@@ -37,44 +37,50 @@ async function initMap() {
 		content: pinRed.element,
 	});
 
+	function selectLocation(address, latitude, longitude) {
+		document.querySelector("#address").textContent = address;
+		document.querySelector("#addressInput").value = address;
+		document.querySelector("#latitude").value = latitude;
+		document.querySelector("#longitude").value = longitude;
+	}
+
 	map.addListener("click", (e) => {
 		let latitude = e.latLng.lat();
 		let longitude = e.latLng.lng();
 		marker.position = { lat: latitude, lng: longitude };
 
-		geocoder.geocode({ location: e.latLng })
-			.then((response) => {
-				let addressComponents = response.results[0].address_components;
-
-				for (let component of addressComponents) {
-					if (component.types.includes('administrative_area_level_2')) {
-						let county = component.long_name;
+		// the server checks the county boundary itself and looks up (and
+		// remembers) addresses when it can, so Google is only asked from
+		// here when it has none
+		fetch(`http://127.0.0.1:5000/geocode?lat=${latitude}&lng=${longitude}`, {
+			method: "GET",
+			headers: {
+				"Content-Type": "application/json",
+			},
+		})
+			.then((response) => response.json())
+			.then((location) => {
+				if (!location.inCounty) {
+					marker = new AdvancedMarkerElement({
+						map,
+						content: pinRed.element,
+					});
 
-						if (county !== "Indiana County") {
-							marker = new AdvancedMarkerElement({
-								map,
-								content: pinRed.element,
-							});
+					alert("Chosen pin is not within Indiana County!");
+					throw new Error("Chosen pin is not within Indiana County!");
+				}
 
-							alert("Chosen pin is not within Indiana County!");
-							throw new Error("Chosen pin is not within Indiana County!");
-						}
-					}
+				if (location.address !== null) {
+					selectLocation(location.address, latitude, longitude);
+					return;
 				}
 
-				let address = response.results[0].formatted_address.replace(", USA", "");
-				document.querySelector("#address").innerHTML = address;
-
-				fetch("http://127.0.0.1:5000/data", {
-					method: "POST",
-					headers: {
-						"Content-Type": "application/json",
-					},
-					body: JSON.stringify({ address: address, latitude: latitude, longitude: longitude }),
-				})
-					.then((response) => response.text())
-					.catch((error) => {
-						console.error("Error:", error);
+				// the location goes to the server with the report form, so
+				// there is nothing to send it now
+				return geocoder.geocode({ location: e.latLng })
+					.then((response) => {
+						let address = response.results[0].formatted_address.replace(", USA", "");
+						selectLocation(address, latitude, longitude);
 					});
 			})
 			.catch((error) => {
@@ -82,52 +88,121 @@ async function initMap() {
 			});
 	});
 
-	fetch("http://127.0.0.1:5000/data", {
-		method: "GET",
-		headers: {
-			"Content-Type": "application/json",
-		},
-	})
-		.then((response) => response.text())
-		.then((data) => {
-			for (let pothole of JSON.parse(data)) {
-				let pinBlue = new PinElement({
-					background: "#0000ff",
-					borderColor: "#051094",
-					glyphColor: "#ffffff",
-				});
-				let previousReport = new AdvancedMarkerElement({
-					map,
-					position: { lat: pothole.latitude, lng: pothole.longitude },
-					content: pinBlue.element,
-				});
-
-				previousReport.address = pothole.address;
-				previousReport.size = pothole.size;
-				previousReport.other = pothole.other;
-				previousReport.repairStatus = pothole.repairStatus;
-				previousReport.reportDate = pothole.reportDate;
-				previousReport.expectedCompletion = pothole.expectedCompletion;
-
-				previousReport.addListener("click", () => {
-					map.setZoom(18);
-					map.setCenter(previousReport.position);
-					document.querySelector(".viewLabel.address").innerHTML = "Street Address:";
-					document.querySelector(".viewDescription.address").innerHTML = previousReport.address;
-					document.querySelector(".viewLabel.size").innerHTML = "Size:";
-					document.querySelector(".viewDescription.size").innerHTML = previousReport.size + "/10";
-					document.querySelector(".viewLabel.repairStatus").innerHTML = "Repair Status:";
-					document.querySelector(".viewDescription.repairStatus").innerHTML = previousReport.repairStatus;
-					document.querySelector(".viewLabel.reportDate").innerHTML = "Report Date:";
-					document.querySelector(".viewDescription.reportDate").innerHTML = previousReport.reportDate;
-					document.querySelector(".viewLabel.expectedCompletion").innerHTML = "Expected Completion Date:";
-					document.querySelector(".viewDescription.expectedCompletion").innerHTML = previousReport.expectedCompletion;
-				});
-			}
-		})
-		.catch((error) => {
-			console.error("Error:", error);
+	// markers for the reports currently in view, keyed by report id
+	const reportMarkers = new Map();
+	// markers for the clusters currently in view
+	let clusterMarkers = [];
+
+	function addClusterMarker(cluster) {
+		let pinCluster = new PinElement({
+			background: "#0000ff",
+			borderColor: "#051094",
+			glyph: String(cluster.count),
+			glyphColor: "#ffffff",
+			scale: Math.min(2.0, 1.0 + Math.log10(cluster.count) / 3),
 		});
+		let clusterMarker = new AdvancedMarkerElement({
+			map,
+			position: { lat: cluster.latitude, lng: cluster.longitude },
+			content: pinCluster.element,
+		});
+
+		clusterMarker.addListener("click", () => {
+			map.setZoom(map.getZoom() + 2);
+			map.setCenter(clusterMarker.position);
+		});
+
+		clusterMarkers.push(clusterMarker);
+	}
+
+	function addReportMarker(pothole) {
+		let pinBlue = new PinElement({
+			background: "#0000ff",
+			borderColor: "#051094",
+			glyphColor: "#ffffff",
+		});
+		let previousReport = new AdvancedMarkerElement({
+			map,
+			position: { lat: pothole.latitude, lng: pothole.longitude },
+			content: pinBlue.element,
+		});
+
+		previousReport.address = pothole.address;
+		previousReport.size = pothole.size;
+		previousReport.other = pothole.other;
+		previousReport.repairStatus = pothole.repairStatus;
+		previousReport.reportDate = pothole.reportDate;
+		previousReport.expectedCompletion = pothole.expectedCompletion;
+
+		previousReport.addListener("click", () => {
+			map.setZoom(18);
+			map.setCenter(previousReport.position);
+			document.querySelector(".viewLabel.address").textContent = "Street Address:";
+			document.querySelector(".viewDescription.address").textContent = previousReport.address;
+			document.querySelector(".viewLabel.size").textContent = "Size:";
+			document.querySelector(".viewDescription.size").textContent = previousReport.size + "/10";
+			document.querySelector(".viewLabel.repairStatus").textContent = "Repair Status:";
+			document.querySelector(".viewDescription.repairStatus").textContent = previousReport.repairStatus;
+			document.querySelector(".viewLabel.reportDate").textContent = "Report Date:";
+			document.querySelector(".viewDescription.reportDate").textContent = previousReport.reportDate;
+			document.querySelector(".viewLabel.expectedCompletion").textContent = "Expected Completion Date:";
+			document.querySelector(".viewDescription.expectedCompletion").textContent = previousReport.expectedCompletion;
+		});
+
+		reportMarkers.set(pothole.id, previousReport);
+	}
+
+	// only ask for what is inside the visible part of the map: clusters
+	// when zoomed out, individual reports when zoomed in
+	map.addListener("idle", () => {
+		let bounds = map.getBounds();
+		if (!bounds) {
+			return;
+		}
+		let sw = bounds.getSouthWest();
+		let ne = bounds.getNorthEast();
+		let bbox = [sw.lng(), sw.lat(), ne.lng(), ne.lat()].join(",");
+
+		fetch(`http://127.0.0.1:5000/clusters?zoom=${map.getZoom()}&bbox=${bbox}&limit=1000`, {
+			method: "GET",
+			headers: {
+				"Content-Type": "application/json",
+			},
+		})
+			.then((response) => response.text())
+			.then((data) => {
+				let response = JSON.parse(data);
+				if (response.truncated) {
+					// the server kept the biggest clusters / the potholes nearest the middle
+					console.warn("Too many potholes in view to show them all, zoom in to see the rest.");
+				}
+
+				for (let clusterMarker of clusterMarkers) {
+					clusterMarker.map = null;
+				}
+				clusterMarkers = [];
+				for (let cluster of response.clusters) {
+					addClusterMarker(cluster);
+				}
+
+				let visible = new Set();
+				for (let pothole of response.reports) {
+					visible.add(pothole.id);
+					if (!reportMarkers.has(pothole.id)) {
+						addReportMarker(pothole);
+					}
+				}
+				for (let [id, previousReport] of reportMarkers) {
+					if (!visible.has(id)) {
+						previousReport.map = null;
+						reportMarkers.delete(id);
+					}
+				}
+			})
+			.catch((error) => {
+				console.error("Error:", error);
+			});
+	});
 }
 
 window.initMap = initMap;
\ No newline at end of file
@@ -0,0 +1,439 @@
+import gzip
+import json
+import struct
+
+import pytest
+
+from ptrs.app import create_app
+from ptrs.app.analytics import GRID_HEADER
+from ptrs.app.county import ReverseGeocoder
+from ptrs.app.storage import SEED_REPORTS
+
+INDIANA = {"latitude": 40.6215, "longitude": -79.1525}
+KITTANNING = {"latitude": 40.8165, "longitude": -79.5220}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def app(request, tmp_path):
+    app = create_app(
+        {
+            "TESTING": True,
+            "STORAGE": request.param,
+            "DATABASE": str(tmp_path / "ptrs.sqlite3"),
+        }
+    )
+    yield app
+    app.extensions["ptrs.store"].close()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def post_pothole(client, **fields):
+    return client.post("/pothole", data={**INDIANA, "size": 50, **fields})
+
+
+def test_pothole_post_stores_the_report(client):
+    response = post_pothole(client, size=70, address="1 Philadelphia St")
+    assert response.status_code == 200
+    reports = client.get("/data").get_json()
+    assert len(reports) == len(SEED_REPORTS) + 1
+    assert reports[-1]["size"] == 7.0
+    assert reports[-1]["address"] == "1 Philadelphia St"
+    assert reports[-1]["repairStatus"] == "Not Repaired"
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        {"size": "big"},
+        {"size": 500},
+        {"size": -5},
+        {"latitude": ""},
+        {"longitude": "west"},
+    ],
+)
+def test_bad_pothole_posts(client, fields):
+    assert post_pothole(client, **fields).status_code == 400
+    # nothing half-stored gets in the way of the next report
+    assert post_pothole(client).status_code == 200
+    assert len(client.get("/data").get_json()) == len(SEED_REPORTS) + 1
+
+
+def test_reports_outside_the_county(client):
+    response = post_pothole(client, **KITTANNING)
+    assert response.status_code == 400
+    assert b"not within Indiana County" in response.data
+    assert len(client.get("/data").get_json()) == len(SEED_REPORTS)
+
+
+def test_pothole_post_without_a_pin(client):
+    assert client.post("/pothole", data={"size": 50}).status_code == 400
+
+
+@pytest.mark.parametrize(
+    "body",
+    [{}, {"latitude": "x", "longitude": 1, "address": ""}, [], None],
+)
+def test_bad_data_posts(client, body):
+    response = client.post(
+        "/data", data=json.dumps(body), content_type="application/json"
+    )
+    assert response.status_code == 400
+
+
+def test_data_post_checks_the_county(client):
+    assert client.post("/data", json=INDIANA).status_code == 200
+    assert client.post("/data", json=KITTANNING).status_code == 400
+
+
+def test_geocode(client):
+    response = client.get("/geocode?lat=40.6215&lng=-79.1525")
+    assert response.get_json()["inCounty"]
+    response = client.get("/geocode?lat=40.8165&lng=-79.5220")
+    assert response.get_json() == {"inCounty": False, "address": None}
+
+
+def test_geocode_never_offers_client_addresses(client):
+    client.post("/data", json={**INDIANA, "address": "Made Up St"})
+    post_pothole(client, address="<img src=x onerror=alert(1)>")
+    response = client.get("/geocode?lat=40.6215&lng=-79.1525")
+    assert response.get_json() == {"inCounty": True, "address": None}
+
+
+def test_geocode_caches_server_lookups(monkeypatch, tmp_path):
+    lookups = []
+
+    def lookup(geocoder, lat, lng):
+        lookups.append((lat, lng))
+        return "1 Philadelphia St, Indiana, PA 15701"
+
+    monkeypatch.setattr(ReverseGeocoder, "lookup", lookup)
+    app = create_app(
+        {
+            "TESTING": True,
+            "STORAGE": "memory",
+            "GEOCODING_API_KEY": "key",
+        }
+    )
+    client = app.test_client()
+    response = client.get("/geocode?lat=40.6215&lng=-79.1525")
+    assert response.get_json()["address"] == "1 Philadelphia St, Indiana, PA 15701"
+    # a click a few meters away is answered from the cache
+    response = client.get("/geocode?lat=40.62152&lng=-79.15252")
+    assert response.get_json()["address"] == "1 Philadelphia St, Indiana, PA 15701"
+    assert lookups == [(40.6215, -79.1525)]
+    # nor is anything outside the county looked up
+    client.get("/geocode?lat=40.8165&lng=-79.5220")
+    assert len(lookups) == 1
+    app.extensions["ptrs.store"].close()
+
+
+@pytest.mark.parametrize("query", ["", "lat=40.62", "lat=x&lng=-79.15"])
+def test_bad_geocode_queries(client, query):
+    assert client.get(f"/geocode?{query}").status_code == 400
+
+
+def test_bulk_import(client):
+    lines = [
+        json.dumps({**INDIANA, "size": 3}),
+        json.dumps({**INDIANA, "size": 8}),
+        "not json",
+        json.dumps(KITTANNING),
+        "[" * 5000,
+    ]
+    response = client.post("/data/bulk", data="\n".join(lines).encode())
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert (summary["inserted"], summary["merged"], summary["rejected"]) == (1, 1, 3)
+    assert [error["line"] for error in summary["errors"]] == [3, 4, 5]
+    reports = client.get("/data").get_json()
+    assert (reports[-1]["size"], reports[-1]["reportCount"]) == (8, 2)
+
+
+def test_bulk_import_merge_distance(client):
+    lines = [json.dumps(INDIANA), json.dumps({**INDIANA, "latitude": 40.6225})]
+    response = client.post("/data/bulk?merge_distance=200", data="\n".join(lines))
+    assert response.get_json()["merged"] == 1
+    for distance in ("far", "inf", "nan", "-1", "1e9"):
+        response = client.post(f"/data/bulk?merge_distance={distance}")
+        assert response.status_code == 400
+
+
+def test_ingest_command(app, client, tmp_path):
+    path = tmp_path / "reports.ndjson"
+    path.write_text(json.dumps(INDIANA) + "\n{\n" + json.dumps(INDIANA) + "\n")
+    result = app.test_cli_runner().invoke(args=["ingest", str(path)])
+    assert result.exit_code == 0
+    assert "1 inserted, 1 merged, 1 rejected" in result.output
+    assert "line 2:" in result.output
+    assert len(client.get("/data").get_json()) == len(SEED_REPORTS) + 1
+    result = app.test_cli_runner().invoke(
+        args=["ingest", "--merge-distance", "inf", str(path)]
+    )
+    assert result.exit_code == 2
+    assert "--merge-distance" in result.output
+
+
+def test_data_queries(client):
+    viewport = "-79.2,40.6,-79.1,40.65"
+    reports = client.get(f"/data?bbox={viewport}").get_json()
+    assert [r["address"] for r in reports] == [SEED_REPORTS[0].address]
+    reports = client.get("/data?lat=40.6179&lng=-79.1435&radius=50").get_json()
+    assert len(reports) == 1
+    assert len(client.get("/data?limit=2").get_json()) == 2
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "lat=40.62&lng=-79.15&radius=-1",
+        "lat=40.62&radius=100",
+        "lat=x&lng=-79.15&radius=100",
+        "lat=inf&lng=-79.15&radius=100",
+        "lat=91&lng=-79.15&radius=100",
+        "lat=40.62&lng=-79.15&radius=nan",
+        "lat=40.62&lng=-79.15&radius=inf",
+        "bbox=1,2,3",
+        "bbox=-79,41,-78,40",
+        "limit=-1",
+        "limit=ten",
+        "status=broken",
+        "severity=huge",
+        "min_size=11",
+        "max_size=nan",
+        "reported_after=yesterday",
+        "since=-1",
+        "since=x",
+        "since=0&limit=-1",
+        "since=9223372036854775808",
+        "since=6",
+        "since=0&bbox=-79.2,40.6,-79.1,40.65",
+        "since=0&lat=40.62&lng=-79.15&radius=100",
+        "since=0&status=Repaired",
+        "since=0&severity=severe",
+        "since=0&min_size=5",
+        "since=0&reported_after=2024-10-27",
+        "since=0&limit=9223372036854775808",
+        "limit=9223372036854775808",
+    ],
+)
+def test_bad_data_queries(client, query):
+    assert client.get(f"/data?{query}").status_code == 400
+
+
+def test_data_filters(app, client):
+    def matching(query):
+        return [r["id"] for r in client.get(f"/data?{query}").get_json()]
+
+    assert matching("severity=severe") == [2, 4]
+    assert matching("severity=minor") == [3, 5]
+    assert matching("min_size=5") == [1, 2, 4]
+    assert matching("min_size=2&max_size=7") == [1, 3, 4]
+    assert matching("reported_after=2024-10-27") == [3, 4, 5]
+    assert matching("reported_before=October 26th 2024") == []
+    app.test_cli_runner().invoke(args=["set-status", "1", "Repaired"])
+    assert matching("status=Repaired") == [1]
+    assert matching("status=0,in progress&severity=moderate") == []
+    assert matching("status=NOT_REPAIRED&limit=2") == [2, 3]
+
+
+def test_since(app, client):
+    body = client.get("/data?since=0").get_json()
+    assert [r["seq"] for r in body["reports"]] == [1, 2, 3, 4, 5]
+    assert body["cursor"] == 5
+    assert client.get("/data?since=5").get_json() == {"reports": [], "cursor": 5}
+    post_pothole(client, address="1 Philadelphia St")
+    app.test_cli_runner().invoke(args=["set-status", "2", "Repaired"])
+    body = client.get("/data?since=5&limit=1").get_json()
+    assert [r["address"] for r in body["reports"]] == ["1 Philadelphia St"]
+    body = client.get(f"/data?since={body['cursor']}").get_json()
+    assert [(r["id"], r["repairStatus"]) for r in body["reports"]] == [(2, "Repaired")]
+    assert body["cursor"] == 7
+
+
+def test_compressed_responses(client):
+    response = client.get("/data", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    plain = client.get("/data")
+    assert "Content-Encoding" not in plain.headers
+    assert json.loads(gzip.decompress(response.data)) == plain.get_json()
+    page = client.get("/pothole", headers={"Accept-Encoding": "gzip"})
+    assert page.mimetype == "text/html"
+    assert b"New Report" in gzip.decompress(page.data)
+
+
+def test_cached_responses_follow_the_data(client):
+    assert len(client.get("/data?severity=severe").get_json()) == 2
+    post_pothole(client, size=90)
+    assert len(client.get("/data?severity=severe").get_json()) == 3
+
+
+def test_responses_without_a_cache(tmp_path):
+    # how the cold benchmarks run
+    app = create_app(
+        {
+            "TESTING": True,
+            "DATABASE": str(tmp_path / "ptrs.sqlite3"),
+            "RESPONSE_CACHE_SIZE": 0,
+        }
+    )
+    client = app.test_client()
+    for _ in range(2):
+        response = client.get("/data", headers={"Accept-Encoding": "gzip"})
+        assert len(json.loads(gzip.decompress(response.data))) == len(SEED_REPORTS)
+    assert len(app.extensions["ptrs.response_cache"]) == 0
+    app.extensions["ptrs.store"].close()
+
+
+def test_data_etag(client):
+    response = client.get("/data", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["ETag"].startswith('W/"')
+    assert response.headers["Content-Encoding"] == "gzip"
+    etag = response.headers["ETag"]
+    # the same validator matches the plain body and the compressed one
+    for encoding in ("gzip", "identity"):
+        response = client.get(
+            "/data", headers={"If-None-Match": etag, "Accept-Encoding": encoding}
+        )
+        assert response.status_code == 304
+        assert response.data == b""
+        assert response.headers["Vary"] == "Accept-Encoding"
+    post_pothole(client)
+    response = client.get("/data", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.get_json()) == len(SEED_REPORTS) + 1
+
+
+def test_clusters(client):
+    body = client.get("/clusters?zoom=10").get_json()
+    assert body["reports"] == []
+    assert sum(c["count"] for c in body["clusters"]) == len(SEED_REPORTS)
+    # zoomed in, the potholes themselves
+    viewport = "-79.2,40.6,-79.1,40.65"
+    body = client.get(f"/clusters?zoom=18&bbox={viewport}").get_json()
+    assert body["clusters"] == []
+    assert [r["address"] for r in body["reports"]] == [SEED_REPORTS[0].address]
+
+
+def test_clusters_limit(client):
+    # zoomed in, the reports nearest the middle of the view are kept
+    viewport = "-79.2,40.5,-78.95,40.7"
+    body = client.get(f"/clusters?zoom=18&bbox={viewport}").get_json()
+    assert len(body["reports"]) == 3 and not body["truncated"]
+    body = client.get(f"/clusters?zoom=18&bbox={viewport}&limit=2").get_json()
+    assert [r["id"] for r in body["reports"]] == [1, 4] and body["truncated"]
+    body = client.get("/clusters?zoom=16&limit=1").get_json()
+    assert len(body["clusters"]) == 1 and body["truncated"]
+    body = client.get("/clusters?zoom=10").get_json()
+    assert not body["truncated"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "",
+        "zoom=ten",
+        "zoom=12&bbox=1,2",
+        "zoom=12&limit=-1",
+        # past the cluster zooms, only a viewport-sized bbox
+        "zoom=18",
+        "zoom=18&bbox=-180,-85,180,85",
+        "zoom=17&bbox=-79.5,40.5,-79.1,40.6",
+    ],
+)
+def test_bad_cluster_queries(client, query):
+    assert client.get(f"/clusters?{query}").status_code == 400
+
+
+def test_set_status(app, client):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["set-status", "1", "Repaired"])
+    assert result.exit_code == 0
+    assert client.get("/data").get_json()[0]["repairStatus"] == "Repaired"
+    clusters = client.get("/clusters?zoom=10").get_json()["clusters"]
+    assert sum(c["open"] for c in clusters) == len(SEED_REPORTS) - 1
+    result = runner.invoke(args=["set-status", "99", "Repaired"])
+    assert result.exit_code == 1
+    assert "There is no report with id 99." in result.output
+    result = runner.invoke(args=["set-status", "2", "Fixed"])
+    assert result.exit_code == 1
+    assert "unknown repair status 'Fixed'" in result.output
+
+
+def test_analytics(app, client):
+    body = client.get("/analytics").get_json()
+    assert body["total"] == body["open"] == len(SEED_REPORTS)
+    assert sum(body["bySeverity"].values()) == len(SEED_REPORTS)
+    assert body["timeToRepair"] == {
+        "windowDays": 30,
+        "repairs": 0,
+        "averageHours": None,
+    }
+    app.test_cli_runner().invoke(args=["set-status", "1", "Repaired"])
+    body = client.get("/analytics?window=7").get_json()
+    assert body["open"] == len(SEED_REPORTS) - 1
+    assert body["byStatus"]["Repaired"] == 1
+    assert body["timeToRepair"]["windowDays"] == 7
+    assert body["timeToRepair"]["repairs"] == 1
+    assert body["timeToRepair"]["averageHours"] > 0
+    # the longest window still counts the repair
+    body = client.get("/analytics?window=36500").get_json()
+    assert body["timeToRepair"]["repairs"] == 1
+
+
+def test_density(client):
+    post_pothole(client)
+    body = client.get("/analytics/density").get_json()
+    assert body["zoom"] == 14
+    assert sum(cell[2] for cell in body["cells"]) == len(SEED_REPORTS) + 1
+
+
+def test_binary_density_grid(client):
+    viewport = "-79.6,40.5,-79.0,40.9"
+    cells = client.get(f"/analytics/density?zoom=12&bbox={viewport}").get_json()
+    cells = cells["cells"]
+    data = client.get(f"/analytics/density?zoom=12&bbox={viewport}&format=binary")
+    assert data.mimetype == "application/octet-stream"
+    data = data.data
+    zoom, min_x, min_y, width, height = GRID_HEADER.unpack_from(data)
+    assert zoom == 12
+    assert len(data) == GRID_HEADER.size + 8 * width * height
+    counts = struct.unpack_from(f"<{2 * width * height}I", data, GRID_HEADER.size)
+    for x, y, count, open_count in cells:
+        i = 2 * ((y - min_y) * width + (x - min_x))
+        assert counts[i : i + 2] == (count, open_count)
+    assert sum(counts[::2]) == sum(cell[2] for cell in cells) > 0
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/analytics?window=0",
+        "/analytics?window=-3",
+        "/analytics?window=36501",
+        "/analytics?window=9223372036854775808",
+        "/analytics?window=week",
+        "/analytics/density?zoom=99",
+        "/analytics/density?zoom=x",
+        "/analytics/density?format=xml",
+        "/analytics/density?bbox=1,2,3",
+        "/analytics/density?zoom=16&bbox=-180,-85,180,85&format=binary",
+    ],
+)
+def test_bad_analytics_queries(client, path):
+    assert client.get(path).status_code == 400
+
+
+def test_data_is_shared_between_apps(tmp_path):
+    config = {"TESTING": True, "DATABASE": str(tmp_path / "ptrs.sqlite3")}
+    first, second = create_app(config), create_app(config)
+    post_pothole(first.test_client())
+    assert len(second.test_client().get("/data").get_json()) == len(SEED_REPORTS) + 1
+    for app in (first, second):
+        app.extensions["ptrs.store"].close()
@@ -0,0 +1,77 @@
+import gzip
+
+from werkzeug.datastructures import Accept
+
+from ptrs.app.cache import MIN_COMPRESS_SIZE, ResponseCache, encode
+
+BODY = b'{"reports": []}' * 100
+
+
+def builder(body=BODY):
+    calls = []
+
+    def build():
+        calls.append(1)
+        return body
+
+    return build, calls
+
+
+def test_hits_until_the_version_changes():
+    cache = ResponseCache()
+    build, calls = builder()
+    first = cache.get("key", 1, build)
+    assert cache.get("key", 1, build) is first
+    assert len(calls) == 1
+    assert cache.get("key", 2, build) is not first
+    assert len(calls) == 2
+    assert len(cache) == 1
+
+
+def test_byte_cap_evicts_least_recently_used():
+    entry_size = sum(len(data) for data in encode(BODY).values())
+    cache = ResponseCache(max_bytes=2 * entry_size)
+    build, calls = builder()
+    cache.get("a", 1, build)
+    cache.get("b", 1, build)
+    cache.get("a", 1, build)  # "a" is now the most recently used
+    cache.get("c", 1, build)
+    assert cache.size == 2 * entry_size
+    assert len(calls) == 3
+    cache.get("a", 1, build)
+    assert len(calls) == 3
+    cache.get("b", 1, build)
+    assert len(calls) == 4
+
+
+def test_entries_over_the_cap_are_not_kept():
+    cache = ResponseCache(max_bytes=100)
+    build, calls = builder()
+    entry = cache.get("key", 1, build)
+    assert entry.variants["identity"] == BODY
+    cache.get("key", 1, build)
+    assert len(calls) == 2
+    assert (len(cache), cache.size) == (0, 0)
+
+
+def test_clear():
+    cache = ResponseCache()
+    cache.get("key", 1, builder()[0])
+    cache.clear()
+    assert (len(cache), cache.size) == (0, 0)
+
+
+def test_encode():
+    variants = encode(BODY)
+    assert variants["identity"] is BODY
+    assert gzip.decompress(variants["gzip"]) == BODY
+    # small or incompressible bodies are only kept as they are
+    small = b"x" * (MIN_COMPRESS_SIZE - 1)
+    assert encode(small) == {"identity": small}
+
+
+def test_negotiate():
+    entry = ResponseCache().get("key", 1, builder()[0])
+    assert entry.negotiate(Accept([("gzip", 1)]))[0] == "gzip"
+    assert entry.negotiate(Accept([("gzip", 0)]))[0] == "identity"
+    assert entry.negotiate(Accept([])) == ("identity", BODY)
@@ -0,0 +1,104 @@
+import io
+import json
+from urllib.error import URLError
+
+import pytest
+
+import ptrs.app.county
+
+from ptrs.app.county import (
+    DEFAULT_BOUNDARY,
+    CountyBoundary,
+    GeocodeCache,
+    ReverseGeocoder,
+)
+from ptrs.app.storage import SEED_REPORTS
+
+INSIDE = {
+    # border towns first, they are the ones a rough outline gets wrong
+    "Saltsburg": (40.4862, -79.4506),
+    "Dilltown": (40.4673, -78.9403),
+    "Blairsville": (40.4312, -79.2609),
+    "Cherry Tree": (40.7262, -78.8056),
+    "Glen Campbell": (40.8153, -78.8309),
+    "Smicksburg": (40.8684, -79.1723),
+    "Armagh": (40.4537, -79.0336),
+    "Indiana": (40.6215, -79.1525),
+    "Homer City": (40.5437, -79.1620),
+    "Marion Center": (40.7701, -79.0467),
+}
+
+OUTSIDE = {
+    "Kittanning": (40.8165, -79.5220),
+    "Elderton": (40.6945, -79.3434),
+    "Punxsutawney": (40.9437, -78.9709),
+    "Mahaffey": (40.8737, -78.7287),
+    "Northern Cambria": (40.6592, -78.7817),
+    "Ebensburg": (40.4850, -78.7248),
+    "Seward": (40.4193, -79.0250),
+    "New Florence": (40.3784, -79.0745),
+    "Latrobe": (40.3212, -79.3795),
+}
+
+
+@pytest.fixture(scope="module")
+def county():
+    return CountyBoundary.from_geojson(DEFAULT_BOUNDARY)
+
+
+@pytest.mark.parametrize("town", INSIDE)
+def test_towns_in_the_county(county, town):
+    assert county.contains(*INSIDE[town])
+
+
+@pytest.mark.parametrize("town", OUTSIDE)
+def test_neighbouring_towns(county, town):
+    assert not county.contains(*OUTSIDE[town])
+
+
+def test_seed_reports_are_in_the_county(county):
+    for report in SEED_REPORTS:
+        assert county.contains(report.latitude, report.longitude)
+
+
+def test_holes_and_multiple_parts():
+    square = [(0, 0), (4, 0), (4, 4), (0, 4)]
+    hole = [(1, 1), (3, 1), (3, 3), (1, 3)]
+    island = [(10, 10), (11, 10), (11, 11), (10, 11)]
+    boundary = CountyBoundary([square, hole, island])
+    assert boundary.contains(0.5, 0.5)
+    assert not boundary.contains(2, 2)
+    assert boundary.contains(10.5, 10.5)
+    assert not boundary.contains(7, 7)
+
+
+def test_geocode_cache_snaps_and_evicts():
+    cache = GeocodeCache(max_size=2)
+    cache.put(40.62151, -79.15251, "a")
+    assert cache.get(40.62149, -79.15249) == "a"
+    cache.put(40.7, -79.0, "b")
+    cache.get(40.62151, -79.15251)
+    cache.put(40.8, -79.0, "c")
+    assert cache.get(40.7, -79.0) is None
+    assert cache.get(40.62151, -79.15251) == "a"
+    assert len(cache) == 2
+
+
+def test_reverse_geocoder(monkeypatch):
+    requests = []
+
+    def urlopen(url, timeout):
+        requests.append(url)
+        if "latlng=0" in url:
+            raise URLError("unreachable")
+        if "latlng=1" in url:
+            return io.BytesIO(b'{"results": [], "status": "ZERO_RESULTS"}')
+        body = {"results": [{"formatted_address": "1 Philadelphia St, PA, USA"}]}
+        return io.BytesIO(json.dumps(body).encode())
+
+    monkeypatch.setattr(ptrs.app.county, "urlopen", urlopen)
+    geocoder = ReverseGeocoder("key")
+    assert geocoder.lookup(40.6215, -79.1525) == "1 Philadelphia St, PA"
+    assert "latlng=40.6215%2C-79.1525&key=key" in requests[0]
+    assert geocoder.lookup(0.0, 0.0) is None
+    assert geocoder.lookup(1.0, 1.0) is None
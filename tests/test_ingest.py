@@ -0,0 +1,54 @@
+import json
+
+from ptrs.app.county import DEFAULT_BOUNDARY, CountyBoundary
+from ptrs.app.ingest import MAX_ERRORS, ingest_ndjson
+from ptrs.app.reports import RepairStatus
+from ptrs.app.storage import MemoryReportStore
+
+INDIANA = {"latitude": 40.6215, "longitude": -79.1525}
+KITTANNING = {"latitude": 40.8165, "longitude": -79.5220}
+
+
+def lines(*records):
+    return [r if isinstance(r, str) else json.dumps(r) for r in records]
+
+
+def test_ingest():
+    store = MemoryReportStore()
+    county = CountyBoundary.from_geojson(DEFAULT_BOUNDARY)
+    summary = ingest_ndjson(
+        store,
+        lines(
+            {**INDIANA, "size": 3, "repairStatus": "In Progress"},
+            "",
+            "{not json",
+            {"latitude": 40.6},
+            KITTANNING,
+            [1, 2],
+            {**INDIANA, "latitude": 40.63, "size": 11},
+            {**INDIANA, "size": 8},
+            {**INDIANA, "latitude": 40.7},
+        ),
+        county=county,
+        batch_size=2,
+    )
+    assert (summary["inserted"], summary["merged"], summary["rejected"]) == (2, 1, 5)
+    assert [error["line"] for error in summary["errors"]] == [3, 4, 5, 6, 7]
+    assert "missing 'longitude'" in summary["errors"][1]["error"]
+    reports = store.all()
+    assert [(r.size, r.report_count) for r in reports] == [(80, 2), (0, 1)]
+    assert reports[0].status == RepairStatus.IN_PROGRESS
+
+
+def test_ingest_reports_only_the_first_errors():
+    store = MemoryReportStore()
+    summary = ingest_ndjson(store, ["{"] * (MAX_ERRORS + 5))
+    assert summary["rejected"] == MAX_ERRORS + 5
+    assert len(summary["errors"]) == MAX_ERRORS
+
+
+def test_ingest_rejects_deeply_nested_lines():
+    store = MemoryReportStore()
+    summary = ingest_ndjson(store, lines("[" * 5000, INDIANA, "{" * 5000 + "}"))
+    assert (summary["inserted"], summary["rejected"]) == (1, 2)
+    assert [error["line"] for error in summary["errors"]] == [1, 3]
@@ -0,0 +1,80 @@
+import pytest
+
+from ptrs.app import create_app
+from ptrs.app.metrics import CONTENT_TYPE, Histogram
+
+
+@pytest.fixture
+def client():
+    app = create_app({"TESTING": True, "STORAGE": "memory", "METRICS": True})
+    return app.test_client()
+
+
+def samples(client):
+    """{(name, labels): value} of every sample at /metrics."""
+    response = client.get("/metrics")
+    assert response.headers["Content-Type"] == CONTENT_TYPE
+    result = {}
+    for line in response.text.splitlines():
+        if line.startswith("#"):
+            continue
+        series, value = line.rsplit(" ", 1)
+        name, _, labels = series.partition("{")
+        result[(name, labels.rstrip("}"))] = float(value)
+    return result
+
+
+def unmatched(method, status):
+    return f'route="unmatched",method="{method}",status="{status}"'
+
+
+def test_histogram():
+    histogram = Histogram((1, 5))
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value)
+    assert list(histogram.samples("x", [("route", "/")])) == [
+        'x_bucket{route="/",le="1"} 2',
+        'x_bucket{route="/",le="5"} 3',
+        'x_bucket{route="/",le="+Inf"} 4',
+        'x_sum{route="/"} 14.5',
+        'x_count{route="/"} 4',
+    ]
+
+
+def test_metrics(client):
+    client.get("/data")
+    client.get("/data")
+    client.get("/data?limit=x")
+    client.get("/no/such/page")
+    metrics = samples(client)
+    data = 'route="/data",method="GET"'
+    assert metrics[("ptrs_requests_total", data + ',status="200"')] == 2
+    assert metrics[("ptrs_requests_total", data + ',status="400"')] == 1
+    assert metrics[("ptrs_request_duration_seconds_count", data)] == 3
+    assert metrics[("ptrs_response_size_bytes_count", data)] == 3
+    # the second request was a response cache hit
+    assert metrics[("ptrs_serialization_duration_seconds_count", data)] == 1
+    assert metrics[("ptrs_requests_total", unmatched("GET", 404))] == 1
+
+
+def test_unknown_methods_share_one_series(client):
+    for method in ("BREW", "PROPFIND", "get2"):
+        assert client.open("/data", method=method).status_code == 405
+    client.open("/data", method="OPTIONS")
+    metrics = samples(client)
+    assert metrics[("ptrs_requests_total", unmatched("other", 405))] == 3
+    assert not any('method="BREW"' in labels for _, labels in metrics)
+    options = 'route="/data",method="OPTIONS",status="200"'
+    assert metrics[("ptrs_requests_total", options)] == 1
+
+
+def test_analytics_serialization(client):
+    client.get("/analytics")
+    metrics = samples(client)
+    analytics = 'route="/analytics",method="GET"'
+    assert metrics[("ptrs_serialization_duration_seconds_count", analytics)] == 1
+
+
+def test_metrics_are_off_by_default():
+    app = create_app({"TESTING": True, "STORAGE": "memory"})
+    assert app.test_client().get("/metrics").status_code == 404
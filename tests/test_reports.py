@@ -0,0 +1,142 @@
+from datetime import datetime
+
+import pytest
+
+from ptrs.app.reports import (
+    RepairStatus,
+    Report,
+    Severity,
+    new_report,
+    report_from_record,
+    to_epoch,
+)
+
+OCTOBER_26TH = int(datetime(2024, 10, 26, 11, 39).timestamp())
+
+
+@pytest.mark.parametrize(
+    "value",
+    [2, "2", "Repaired", "repaired", " REPAIRED ", RepairStatus.REPAIRED],
+)
+def test_repair_status_parse(value):
+    assert RepairStatus.parse(value) is RepairStatus.REPAIRED
+
+
+@pytest.mark.parametrize("value", ["Fixed", "7", 3])
+def test_repair_status_parse_rejects(value):
+    with pytest.raises(ValueError):
+        RepairStatus.parse(value)
+
+
+def test_severity():
+    assert [Severity.of(size) for size in (0, 39, 40, 69, 70, 100)] == [
+        Severity.MINOR,
+        Severity.MINOR,
+        Severity.MODERATE,
+        Severity.MODERATE,
+        Severity.SEVERE,
+        Severity.SEVERE,
+    ]
+    for severity in Severity:
+        low, high = severity.sizes
+        assert Severity.of(low) == Severity.of(high) == severity
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        OCTOBER_26TH,
+        float(OCTOBER_26TH),
+        "2024-10-26T11:39",
+        "11:39AM on October 26th 2024",
+    ],
+)
+def test_to_epoch(value):
+    assert to_epoch(value) == OCTOBER_26TH
+
+
+def test_to_epoch_dates():
+    assert to_epoch("October 28th 2024") == int(datetime(2024, 10, 28).timestamp())
+    assert to_epoch("12:05AM on October 27th 2024") == int(
+        datetime(2024, 10, 27, 0, 5).timestamp()
+    )
+
+
+@pytest.mark.parametrize("value", ["yesterday", "October 32nd 2024", 10**20])
+def test_to_epoch_rejects(value):
+    with pytest.raises(ValueError):
+        to_epoch(value)
+
+
+def test_to_dict():
+    report = Report(
+        latitude=40.6,
+        longitude=-79.1,
+        address="310 Locust St",
+        size=55,
+        status=RepairStatus.IN_PROGRESS,
+        reported_at=OCTOBER_26TH,
+        expected_at=to_epoch("October 28th 2024"),
+        id=3,
+        seq=9,
+    )
+    assert report.to_dict() == {
+        "id": 3,
+        "latitude": 40.6,
+        "longitude": -79.1,
+        "address": "310 Locust St",
+        "size": 5.5,
+        "location": "",
+        "other": "",
+        "repairStatus": "In Progress",
+        "reportDate": "11:39AM on October 26th 2024",
+        "expectedCompletion": "October 28th 2024",
+        "reportCount": 1,
+        "seq": 9,
+    }
+
+
+def test_new_report():
+    report = new_report(
+        "40.6", "-79.1", None, "4.25", now=datetime(2024, 10, 26, 11, 39)
+    )
+    assert (report.latitude, report.longitude, report.address) == (40.6, -79.1, "")
+    assert report.size == 42
+    assert report.status == RepairStatus.NOT_REPAIRED
+    assert report.to_dict()["expectedCompletion"] == "October 28th 2024"
+
+
+@pytest.mark.parametrize("size", ["11", "-0.5", "nan", "inf", "big"])
+def test_new_report_rejects(size):
+    with pytest.raises((ValueError, OverflowError)):
+        new_report(40.6, -79.1, "", size)
+
+
+def test_report_from_record():
+    report = report_from_record(
+        {
+            "latitude": 40.6,
+            "longitude": -79.1,
+            "size": 7,
+            "repairStatus": "Repaired",
+            "reportDate": "11:39AM on October 26th 2024",
+        }
+    )
+    assert (report.size, report.status) == (70, RepairStatus.REPAIRED)
+    assert report.reported_at == OCTOBER_26TH
+
+
+@pytest.mark.parametrize(
+    "record",
+    [
+        [],
+        {"latitude": 40.6},
+        {"latitude": 40.6, "longitude": "west"},
+        {"latitude": 40.6, "longitude": -79.1, "size": 12},
+        {"latitude": 40.6, "longitude": -79.1, "size": [1]},
+        {"latitude": 40.6, "longitude": -79.1, "repairStatus": "Fixed"},
+    ],
+)
+def test_report_from_record_rejects(record):
+    with pytest.raises(ValueError):
+        report_from_record(record)
@@ -0,0 +1,41 @@
+import pytest
+
+from ptrs.app.spatial import GridIndex, distance_m, parse_bbox, parse_point, radius_bbox
+
+
+def test_distance():
+    # one degree of latitude is about 111.2 km everywhere
+    assert distance_m(40.0, -79.0, 41.0, -79.0) == pytest.approx(111_195, rel=1e-3)
+    assert distance_m(40.6, -79.1, 40.6, -79.1) == 0
+
+
+def test_radius_bbox_covers_the_circle():
+    west, south, east, north = radius_bbox(40.6, -79.1, 1000)
+    assert distance_m(40.6, -79.1, north, -79.1) == pytest.approx(1000)
+    assert distance_m(40.6, -79.1, 40.6, east) == pytest.approx(1000, rel=1e-3)
+    # centred on the point
+    assert north - 40.6 == pytest.approx(40.6 - south)
+    assert east + 79.1 == pytest.approx(-79.1 - west)
+
+
+@pytest.mark.parametrize("text", ["1,2,3", "a,b,c,d", "0,1,1,0", "-181,0,0,1"])
+def test_parse_bbox_rejects(text):
+    with pytest.raises(ValueError):
+        parse_bbox(text)
+
+
+def test_parse_point():
+    assert parse_point("40.6", "-79.1") == (40.6, -79.1)
+    for lat, lng in [("91", "0"), ("0", "-181"), ("nan", "0"), ("0", "inf")]:
+        with pytest.raises(ValueError):
+            parse_point(lat, lng)
+
+
+def test_grid_index_search():
+    index = GridIndex(cell_size=0.01)
+    index.insert(1, 40.601, -79.101)
+    index.insert(2, 40.655, -79.155)
+    index.insert(3, 40.7, -79.0)
+    found = sorted(entry[0] for entry in index.search((-79.16, 40.6, -79.1, 40.66)))
+    assert found == [1, 2]
+    assert list(index.search((0.0, 0.0, 1.0, 1.0))) == []
@@ -0,0 +1,266 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from ptrs.app.analytics import DENSITY_ZOOM
+from ptrs.app.clusters import ZOOM_LEVELS
+from ptrs.app.reports import RepairStatus, Report, ReportFilter, Severity, is_open
+from ptrs.app.spatial import WORLD, distance_m
+from ptrs.app.storage import MemoryReportStore, SQLiteReportStore
+
+# around the town of Indiana, PA; 0.001 degrees of latitude is about 111 m
+LAT, LNG = 40.6215, -79.1525
+
+
+def report(dlat=0.0, dlng=0.0, size=50, status=RepairStatus.NOT_REPAIRED, day=0):
+    reported_at = 1_700_000_000 + day * 86400
+    return Report(
+        latitude=LAT + dlat,
+        longitude=LNG + dlng,
+        address=f"{dlat} {dlng}",
+        size=size,
+        status=status,
+        reported_at=reported_at,
+        expected_at=reported_at + 2 * 86400,
+    )
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryReportStore()
+    else:
+        store = SQLiteReportStore(str(tmp_path / "ptrs.sqlite3"), batch_size=3)
+    yield store
+    store.close()
+
+
+def ids(reports):
+    return [r.id for r in reports]
+
+
+def check_aggregates(store):
+    """Clusters, density and stats must all agree with the stored reports."""
+    reports = store.all()
+    total = len(reports)
+    open_total = sum(is_open(r.status) for r in reports)
+    for zoom in ZOOM_LEVELS:
+        clusters = store.clusters(zoom, WORLD)
+        assert sum(c["count"] for c in clusters) == total
+        assert sum(c["open"] for c in clusters) == open_total
+    cells = store.density(DENSITY_ZOOM, WORLD)
+    assert sum(cell[2] for cell in cells) == total
+    assert sum(cell[3] for cell in cells) == open_total
+    assert [cell[:2] for cell in cells] == sorted(
+        (cell[:2] for cell in cells), key=lambda xy: (xy[1], xy[0])
+    )
+    expected = {}
+    for r in reports:
+        key = (RepairStatus(r.status), Severity.of(r.size))
+        expected[key] = expected.get(key, 0) + 1
+    assert store.stats() == expected
+
+
+def test_add_and_add_many(store):
+    assert store.count() == 0
+    assert store.add(report()) == 1
+    assert store.add_many(report(dlat=0.01 * i) for i in range(1, 8)) == 7
+    assert store.count() == 8
+    assert ids(store.all()) == list(range(1, 9))
+    first = store.all()[0]
+    assert (first.latitude, first.longitude, first.size) == (LAT, LNG, 50)
+    assert first.address == "0.0 0.0"
+    assert first.status == RepairStatus.NOT_REPAIRED
+    assert (first.reported_at, first.expected_at) == (1_700_000_000, 1_700_172_800)
+    assert first.report_count == 1
+    check_aggregates(store)
+
+
+def test_merge_many(store):
+    store.add(report(size=30))
+    store.add(report(dlat=0.01, status=RepairStatus.REPAIRED))
+    batch = [
+        report(dlng=0.00005, size=60),  # ~4 m from report 1
+        report(dlat=0.01, dlng=0.00005),  # near report 2, but that is repaired
+        report(dlat=0.05),
+        report(dlat=0.05, dlng=0.00005, size=90),  # near the one above
+    ]
+    assert store.merge_many(batch, 10.0) == (2, 2)
+    assert store.count() == 4
+    reports = store.all()
+    assert [r.report_count for r in reports] == [2, 1, 1, 2]
+    assert [r.size for r in reports] == [60, 50, 50, 90]
+    assert store.merge_many([report(dlng=0.001)], 0.0) == (1, 0)
+    check_aggregates(store)
+
+
+def test_query_bbox_and_limit(store):
+    store.add_many(report(dlat=0.01 * i, dlng=0.01 * i) for i in range(10))
+    bbox = (LNG + 0.015, LAT + 0.015, LNG + 0.055, LAT + 0.055)
+    assert ids(store.query(bbox=bbox)) == [3, 4, 5, 6]
+    assert ids(store.query(bbox=bbox, limit=2)) == [3, 4]
+    assert ids(store.query(limit=3)) == [1, 2, 3]
+    assert store.query(limit=0) == []
+    assert store.query(bbox=(0.0, 0.0, 1.0, 1.0)) == []
+    assert ids(store.query()) == ids(store.all())
+
+
+def test_query_near(store):
+    offsets = [0.003, 0.0, 0.001, 0.02]
+    store.add_many(report(dlat=dlat) for dlat in offsets)
+    near = store.query(near=(LAT, LNG, 500))
+    assert ids(near) == [2, 3, 1]
+    for r in near:
+        assert distance_m(LAT, LNG, r.latitude, r.longitude) <= 500
+    assert ids(store.query(near=(LAT, LNG, 500), limit=2)) == [2, 3]
+    bbox = (LNG - 0.01, LAT + 0.0005, LNG + 0.01, LAT + 0.01)
+    assert ids(store.query(bbox=bbox, near=(LAT, LNG, 500))) == [3, 1]
+    assert store.query(bbox=(0.0, 0.0, 1.0, 1.0), near=(LAT, LNG, 500)) == []
+
+
+def test_query_filters(store):
+    store.add_many(
+        [
+            report(size=10, day=0),
+            report(size=50, day=1, status=RepairStatus.IN_PROGRESS),
+            report(size=80, day=2, status=RepairStatus.REPAIRED),
+            report(size=100, day=3),
+        ]
+    )
+    day = 86400
+
+    def matching(**filters):
+        return ids(store.query(filters=ReportFilter(**filters)))
+
+    assert matching() == [1, 2, 3, 4]
+    assert matching(statuses={RepairStatus.NOT_REPAIRED}) == [1, 4]
+    assert matching(min_size=50) == [2, 3, 4]
+    assert matching(max_size=50) == [1, 2]
+    assert matching(min_size=40, max_size=80) == [2, 3]
+    assert matching(reported_after=1_700_000_000 + day) == [2, 3, 4]
+    assert matching(reported_before=1_700_000_000 + 2 * day) == [1, 2, 3]
+    open_statuses = {RepairStatus.NOT_REPAIRED, RepairStatus.IN_PROGRESS}
+    filters = ReportFilter(statuses=open_statuses, min_size=40)
+    assert ids(store.query(near=(LAT, LNG, 100), filters=filters)) == [2, 4]
+    assert ids(store.query(filters=filters, limit=1)) == [2]
+    bbox = (LNG - 0.01, LAT - 0.01, LNG + 0.01, LAT + 0.01)
+    assert ids(store.query(bbox=bbox, filters=filters)) == [2, 4]
+
+
+def test_changes_since_paging(store):
+    assert store.version() == 0
+    assert store.changes_since(0) == ([], 0)
+    store.add_many(report(dlat=0.001 * i) for i in range(5))
+    store.update_status(2, RepairStatus.REPAIRED)
+    store.merge_many([report(dlat=0.004)], 10.0)
+    assert store.version() == 7
+
+    seen, cursor = [], 0
+    while True:
+        page, cursor = store.changes_since(cursor, limit=2)
+        if not page:
+            break
+        assert len(page) <= 2
+        seen += page
+    # each report once, at its latest change
+    assert ids(seen) == [1, 3, 4, 2, 5]
+    assert [r.seq for r in seen] == [1, 3, 4, 6, 7]
+    assert seen[3].status == RepairStatus.REPAIRED
+    assert seen[4].report_count == 2
+    assert cursor == store.version()
+    assert store.changes_since(cursor) == ([], cursor)
+    everything, _ = store.changes_since(0)
+    assert ids(everything) == ids(seen)
+
+
+def test_clusters(store):
+    store.add_many([report(), report(dlng=0.002), report(dlat=0.2)])
+    clusters = store.clusters(10, WORLD)
+    assert sorted(c["count"] for c in clusters) == [1, 2]
+    pair = max(clusters, key=lambda c: c["count"])
+    assert (pair["latitude"], pair["longitude"]) == pytest.approx((LAT, LNG + 0.001))
+    # zoomed in, the two close reports get a cell each
+    assert len(store.clusters(16, WORLD)) == 3
+    assert store.clusters(12, (0.0, 0.0, 1.0, 1.0)) == []
+
+
+def test_update_status(store):
+    store.add_many(report(dlat=0.001 * i, size=20 * i) for i in range(5))
+    assert store.repairs(0) == (0, 0)
+    assert store.update_status(2, RepairStatus.IN_PROGRESS)
+    check_aggregates(store)
+    assert store.update_status(2, RepairStatus.REPAIRED)
+    assert store.update_status(5, RepairStatus.REPAIRED)
+    check_aggregates(store)
+    assert [r.status for r in store.all()] == [
+        RepairStatus.NOT_REPAIRED,
+        RepairStatus.REPAIRED,
+        RepairStatus.NOT_REPAIRED,
+        RepairStatus.NOT_REPAIRED,
+        RepairStatus.REPAIRED,
+    ]
+    repaired, seconds = store.repairs(0)
+    assert repaired == 2 and seconds > 0
+    # reopening a report counts it as open again, but keeps the repair history
+    assert store.update_status(5, RepairStatus.NOT_REPAIRED)
+    check_aggregates(store)
+    assert store.repairs(0)[0] == 2
+    assert store.repairs(time.time() + 86400) == (0, 0)
+    assert not store.update_status(99, RepairStatus.REPAIRED)
+    assert store.count() == 5
+
+
+def test_merges_keep_stats_in_step(store):
+    store.add(report(size=30))
+    store.merge_many([report(size=90)], 10.0)
+    check_aggregates(store)
+    assert store.stats() == {(RepairStatus.NOT_REPAIRED, Severity.SEVERE): 1}
+
+
+def test_density(store):
+    store.add_many([report(), report(dlng=0.0001), report(dlat=0.1)])
+    store.update_status(3, RepairStatus.REPAIRED)
+    cells = store.density(DENSITY_ZOOM, WORLD)
+    assert sorted(cell[2:] for cell in cells) == [(1, 0), (2, 2)]
+    assert store.density(DENSITY_ZOOM, (0.0, 0.0, 1.0, 1.0)) == []
+
+
+def test_rejected_insert_leaves_the_store_consistent(store):
+    store.add(report())
+    with pytest.raises((OverflowError, sqlite3.IntegrityError)):
+        store.add(report(size=300))
+    assert store.count() == 1
+    assert store.add(report(dlat=0.01, size=70)) == 2
+    assert [r.size for r in store.all()] == [50, 70]
+    check_aggregates(store)
+
+
+def test_seed_only_fills_an_empty_store(store):
+    store.seed([report(), report(dlat=0.01)])
+    store.seed([report(dlat=0.02)])
+    assert store.count() == 2
+
+
+def test_concurrent_adds(store):
+    def submit():
+        for _ in range(20):
+            store.add(report())
+
+    threads = [threading.Thread(target=submit) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert ids(store.all()) == list(range(1, 81))
+
+
+def test_sqlite_reports_survive_reopening(tmp_path):
+    path = str(tmp_path / "ptrs.sqlite3")
+    store = SQLiteReportStore(path)
+    store.add(report(size=70))
+    store.close()
+    store = SQLiteReportStore(path)
+    assert [r.size for r in store.all()] == [70]
+    store.close()